@@ -1,5 +1,5 @@
 from dataclasses import field
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from FloatingPoint.UnsignedDecimal import UnsignedDecimalIsSignedException
 from ILiquidity import *
@@ -35,19 +35,91 @@ class Bucket:
     acc_x: UnsignedDecimal = UnsignedDecimal(0)
     acc_y: UnsignedDecimal = UnsignedDecimal(0)
     snapshots: List[Snapshot] = field(default_factory=list)
+    # The same snapshots indexed by (low, high), a range has at most one snapshot per bucket
+    snapshots_by_range: Dict[Tuple[int, int], Snapshot] = field(default_factory=dict)
+
+    # Running totals over the range snapshots, borrows are per tick. The wide snapshot is shared by every bucket
+    # and changed once for all of them, so it is left out and added when a total is read.
+    wide: Snapshot = None
+    range_m_liq: UnsignedDecimal = UnsignedDecimal(0)
+    range_t_liq: UnsignedDecimal = UnsignedDecimal(0)
+    range_borrow_x: UnsignedDecimal = UnsignedDecimal(0)
+    range_borrow_y: UnsignedDecimal = UnsignedDecimal(0)
+    range_total_m_liq: UnsignedDecimal = UnsignedDecimal(0)
+
+    def snapshot(self, liq_range: LiqRange) -> Optional[Snapshot]:
+        return self.snapshots_by_range.get((liq_range.low, liq_range.high))
+
+    def add_snapshot(self, snap: Snapshot) -> None:
+        self.snapshots.append(snap)
+        self.snapshots_by_range[(snap.range.low, snap.range.high)] = snap
+        if snap is not self.wide:
+            self._add_to_totals(snap, snap.m_liq, snap.t_liq, snap.borrow_x, snap.borrow_y)
+
+    def change(self, snap: Snapshot, name: str, amount: UnsignedDecimal, removing: bool = False) -> None:
+        """Adds or removes an amount from one field of a snapshot in this bucket, keeping the totals in step."""
+        value: UnsignedDecimal = getattr(snap, name)
+        setattr(snap, name, value - amount if removing else value + amount)
+
+        if snap is not self.wide:
+            if removing:
+                self._remove_from_totals(snap, **{name: amount})
+            else:
+                self._add_to_totals(snap, **{name: amount})
+
+    def _add_to_totals(self, snap: Snapshot, m_liq=0, t_liq=0, borrow_x=0, borrow_y=0) -> None:
+        width: UnsignedDecimal = snap.width()
+        self.range_m_liq += m_liq
+        self.range_t_liq += t_liq
+        self.range_borrow_x += borrow_x / width
+        self.range_borrow_y += borrow_y / width
+        self.range_total_m_liq += m_liq * width
+
+    def _remove_from_totals(self, snap: Snapshot, m_liq=0, t_liq=0, borrow_x=0, borrow_y=0) -> None:
+        width: UnsignedDecimal = snap.width()
+        self.range_m_liq -= m_liq
+        self.range_t_liq -= t_liq
+        self.range_borrow_x -= borrow_x / width
+        self.range_borrow_y -= borrow_y / width
+        self.range_total_m_liq -= m_liq * width
+
+    def m_liq(self) -> UnsignedDecimal:
+        return self.range_m_liq + self.wide.m_liq
+
+    def t_liq(self) -> UnsignedDecimal:
+        return self.range_t_liq + self.wide.t_liq
+
+    def borrow_x(self) -> UnsignedDecimal:
+        return self.range_borrow_x + self.wide.borrow_x / self.wide.width()
+
+    def borrow_y(self) -> UnsignedDecimal:
+        return self.range_borrow_y + self.wide.borrow_y / self.wide.width()
+
+    def total_m_liq(self) -> UnsignedDecimal:
+        return self.range_total_m_liq + self.wide.total_m_liq()
 
 
 class LiquidityBucket(ILiquidity):
-    def __init__(self, size, sol_truncation=True):
+    def __init__(self, size, sol_truncation=True, sparse=False):
         self.sol_truncation = sol_truncation
+        self.size: int = size
 
-        self._buckets = [Bucket() for n in range(0, size)]
         self._wide_snapshot = Snapshot(range=LiqRange(0, size - 1))
-        self._wide_bucket = Bucket()
-        self._wide_bucket.snapshots.append(self._wide_snapshot)
-        for bucket in self._buckets:
-            # maintain the same reference to the wide range in all buckets
-            bucket.snapshots.append(self._wide_snapshot)
+        self._wide_bucket = Bucket(wide=self._wide_snapshot)
+        self._wide_bucket.add_snapshot(self._wide_snapshot)
+
+        # Sparse buckets only hold the ticks a range op or fee query has touched. The untouched ticks only hold the
+        # wide snapshot and are only ever accrued together, by the wide queries, so one bucket stands in for all of them.
+        self._untouched_bucket: Optional[Bucket] = None
+        if sparse:
+            self._buckets: Dict[int, Bucket] = {}
+            self._untouched_bucket = Bucket(wide=self._wide_snapshot)
+            self._untouched_bucket.add_snapshot(self._wide_snapshot)
+        else:
+            self._buckets: List[Bucket] = [Bucket(wide=self._wide_snapshot) for n in range(0, size)]
+            for bucket in self._buckets:
+                # maintain the same reference to the wide range in all buckets
+                bucket.add_snapshot(self._wide_snapshot)
 
         self.token_x_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
         self.token_y_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
@@ -56,16 +128,16 @@ class LiquidityBucket(ILiquidity):
         """Adds mLiq to the provided range. Liquidity provided is per tick. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
 
         for tick in range(liq_range.low, liq_range.high + 1):
-            bucket: Bucket = self._buckets[tick]
-            snap = next(iter([snap for snap in bucket.snapshots if snap.range.low == liq_range.low and snap.range.high == liq_range.high]), None)
+            bucket: Bucket = self._touch(tick)
+            snap = bucket.snapshot(liq_range)
 
             self._accumulate_fees(bucket)
 
             if snap is None:
                 snap = Snapshot(range=liq_range.copy(), m_liq=liq)
-                bucket.snapshots.append(snap)
+                bucket.add_snapshot(snap)
             else:
-                snap.m_liq += liq
+                bucket.change(snap, "m_liq", liq)
 
         (min_m_liq, _) = self.query_min_m_liq_max_t_liq(liq_range)
         (acc_rate_x, acc_rate_y) = self.query_accumulated_fee_rates(liq_range)
@@ -75,16 +147,16 @@ class LiquidityBucket(ILiquidity):
         """Removes mLiq from the provided range. Liquidity provided is per tick. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
 
         for tick in range(liq_range.low, liq_range.high + 1):
-            bucket: Bucket = self._buckets[tick]
-            snap = next(iter([snap for snap in bucket.snapshots if snap.range.low == liq_range.low and snap.range.high == liq_range.high]), None)
+            snap = self._bucket(tick).snapshot(liq_range)
 
             if snap is None:
                 raise LiquidityExceptionRemovingMoreMLiqThanExists()
 
+            bucket: Bucket = self._touch(tick)
             self._accumulate_fees(bucket)
 
             try:
-                snap.m_liq -= liq
+                bucket.change(snap, "m_liq", liq, removing=True)
             except UnsignedDecimalIsSignedException:
                 raise LiquidityExceptionRemovingMoreMLiqThanExists()
 
@@ -96,20 +168,20 @@ class LiquidityBucket(ILiquidity):
         """Adds tLiq to the provided range. Liquidity provided is per tick. Borrowing given amounts. Returns the max tLiq."""
 
         for tick in range(liq_range.low, liq_range.high + 1):
-            bucket: Bucket = self._buckets[tick]
-            snap = next(iter([snap for snap in bucket.snapshots if snap.range.low == liq_range.low and snap.range.high == liq_range.high]), None)
+            snap = self._bucket(tick).snapshot(liq_range)
 
             if snap is None:
                 raise LiquidityExceptionTLiqExceedsMLiq()
 
+            bucket: Bucket = self._touch(tick)
             self._accumulate_fees(bucket)
 
             # check tLiq does not exceed mLiq
 
             try:
-                snap.t_liq += liq
-                snap.borrow_x += amount_x
-                snap.borrow_y += amount_y
+                bucket.change(snap, "t_liq", liq)
+                bucket.change(snap, "borrow_x", amount_x)
+                bucket.change(snap, "borrow_y", amount_y)
             except UnsignedDecimalIsSignedException:
                 raise LiquidityExceptionTLiqExceedsMLiq()
 
@@ -120,20 +192,19 @@ class LiquidityBucket(ILiquidity):
         """Removes tLiq to the provided range. Liquidity provided is per tick. Repaying given amounts. Returns the max tLiq."""
 
         for tick in range(liq_range.low, liq_range.high + 1):
-            bucket: Bucket = self._buckets[tick]
-            snap = next(iter([snap for snap in bucket.snapshots if snap.range.low == liq_range.low and snap.range.high == liq_range.high]), None)
+            snap = self._bucket(tick).snapshot(liq_range)
 
             if snap is None:
-                # TODO: add more detailed exceptions
-                raise Exception()
+                raise LiquidityExceptionRemovingMoreTLiqThanExists()
 
+            bucket: Bucket = self._touch(tick)
             self._accumulate_fees(bucket)
 
             # try:
             # TODO: add more detailed exceptions
-            snap.t_liq -= liq
-            snap.borrow_x -= amount_x
-            snap.borrow_y -= amount_y
+            bucket.change(snap, "t_liq", liq, removing=True)
+            bucket.change(snap, "borrow_x", amount_x, removing=True)
+            bucket.change(snap, "borrow_y", amount_y, removing=True)
             # except UnsignedDecimalIsSignedException:
             #     raise LiquidityExceptionTLiqExceedsMLiq()
 
@@ -182,14 +253,14 @@ class LiquidityBucket(ILiquidity):
         max_t_liq: UnsignedDecimal = UnsignedDecimal(0)
 
         for tick in range(liq_range.low, liq_range.high + 1):
-            bucket: Bucket = self._buckets[tick]
+            bucket: Bucket = self._bucket(tick)
 
             if min_m_liq is None:
-                min_m_liq = sum([snap.m_liq for snap in bucket.snapshots])
+                min_m_liq = bucket.m_liq()
             else:
-                min_m_liq = min(sum([snap.m_liq for snap in bucket.snapshots]), min_m_liq)
+                min_m_liq = min(bucket.m_liq(), min_m_liq)
 
-            max_t_liq = max(sum([snap.t_liq for snap in bucket.snapshots]), max_t_liq)
+            max_t_liq = max(bucket.t_liq(), max_t_liq)
 
         return min_m_liq, max_t_liq
 
@@ -198,18 +269,15 @@ class LiquidityBucket(ILiquidity):
 
         wide_max_t_liq: UnsignedDecimal = self._wide_snapshot.t_liq
 
-        for bucket in self._buckets:
-            wide_max_t_liq = max(sum([snap.t_liq for snap in bucket.snapshots]), wide_max_t_liq)
+        for bucket in self._touched_buckets():
+            wide_max_t_liq = max(bucket.t_liq(), wide_max_t_liq)
 
         return self._wide_snapshot.m_liq, wide_max_t_liq
 
     def query_accumulated_fee_rates(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
         """Returns the accumulated fee rates per mLiq for each token over the provided range."""
 
-        queried_indices = range(liq_range.low, liq_range.high + 1)
-        buckets = [bucket for idx, bucket in enumerate(self._buckets) if idx in queried_indices]
-        for b in buckets:
-            self._accumulate_fees(b)
+        buckets = [self._accrued(tick) for tick in range(liq_range.low, liq_range.high + 1)]
 
         acc_rate_x = sum([b.acc_x for b in buckets])
         acc_rate_y = sum([b.acc_y for b in buckets])
@@ -218,24 +286,76 @@ class LiquidityBucket(ILiquidity):
     def query_wide_accumulated_fee_rates(self) -> (UnsignedDecimal, UnsignedDecimal):
         """Returns the accumulated fee rates per mLiq for each token over the wide range."""
 
-        for bucket in self._buckets:
+        buckets = self._touched_buckets()
+        for bucket in buckets:
             self._accumulate_fees(bucket)
 
-        acc_rate_x = sum([bucket.acc_x for bucket in self._buckets])
-        acc_rate_y = sum([bucket.acc_y for bucket in self._buckets])
+        acc_rate_x = sum([bucket.acc_x for bucket in buckets])
+        acc_rate_y = sum([bucket.acc_y for bucket in buckets])
+
+        if self._untouched_bucket is not None:
+            untouched: Bucket = self._untouched_bucket
+            self._accumulate_fees(untouched)
+            untouched_ticks: int = self.size - len(self._buckets)
+            acc_rate_x += untouched.acc_x * untouched_ticks
+            acc_rate_y += untouched.acc_y * untouched_ticks
+
         return acc_rate_x, acc_rate_y
 
+    # region Sparse Buckets
+
+    def _bucket(self, tick: int) -> Bucket:
+        """The bucket of a tick to read from, the untouched bucket for a sparse tick nothing has touched yet."""
+        if self._untouched_bucket is None:
+            return self._buckets[tick]
+        return self._buckets.get(tick, self._untouched_bucket)
+
+    def _touch(self, tick: int) -> Bucket:
+        """The bucket of a tick to change, a sparse tick gets its own copy of the untouched bucket."""
+        if self._untouched_bucket is None:
+            return self._buckets[tick]
+
+        bucket: Optional[Bucket] = self._buckets.get(tick)
+        if bucket is None:
+            untouched: Bucket = self._untouched_bucket
+            bucket = Bucket(rate_x=untouched.rate_x, rate_y=untouched.rate_y, acc_x=untouched.acc_x, acc_y=untouched.acc_y, wide=self._wide_snapshot)
+            bucket.add_snapshot(self._wide_snapshot)
+            self._buckets[tick] = bucket
+        return bucket
+
+    def _touched_buckets(self) -> List[Bucket]:
+        if self._untouched_bucket is None:
+            return self._buckets
+        return list(self._buckets.values())
+
+    def _accrued(self, tick: int) -> Bucket:
+        """The bucket of a tick with its fees accrued. An untouched tick is only split off when it has fees to accrue."""
+        bucket: Bucket = self._bucket(tick)
+        if bucket is self._untouched_bucket and not self._is_current(bucket):
+            bucket = self._touch(tick)
+        self._accumulate_fees(bucket)
+        return bucket
+
+    # endregion
+
+    def _is_current(self, bucket: Bucket) -> bool:
+        return bucket.rate_x == self.token_x_fee_rate_snapshot and bucket.rate_y == self.token_y_fee_rate_snapshot
+
     def _accumulate_fees(self, bucket: Bucket):
+        # Nothing to accrue while the bucket's rates are current
+        if self._is_current(bucket):
+            return
+
         rate_x = self.token_x_fee_rate_snapshot - bucket.rate_x
         bucket.rate_x = self.token_x_fee_rate_snapshot
 
         rate_y = self.token_y_fee_rate_snapshot - bucket.rate_y
         bucket.rate_y = self.token_y_fee_rate_snapshot
 
-        borrow_x = sum([snap.borrow_x / snap.width() for snap in bucket.snapshots])
-        borrow_y = sum([snap.borrow_y / snap.width() for snap in bucket.snapshots])
+        borrow_x = bucket.borrow_x()
+        borrow_y = bucket.borrow_y()
 
-        total_m_liq = sum([snap.total_m_liq() for snap in bucket.snapshots])
+        total_m_liq = bucket.total_m_liq()
         if total_m_liq == UnsignedDecimal(0):
             return
 
@@ -0,0 +1,251 @@
+from decimal import Decimal
+from typing import Dict, Tuple
+
+import numpy as np
+
+from FloatingPoint.UnsignedDecimal import UnsignedDecimalIsSignedException
+from Bucket.LiquidityBucket import Snapshot
+from ILiquidity import *
+from LiquidityExceptions import *
+
+
+#  Liquidity Bucket Arrays
+#
+#  The same model as LiquidityBucket with every per tick total held in one NumPy array indexed by tick.
+#  A range op is a slice update, a liquidity query a slice reduction, and fee accrual one expression over a slice.
+#
+#  Every tick of a range holds the same snapshot, so snapshots are kept once per range as exact values and
+#  only their totals are spread over the arrays. Ops check the snapshot before touching any tick, so a rejected
+#  op leaves the arrays untouched where LiquidityBucket stops partway through the range.
+#
+#  Exact mode keeps Decimals in object arrays and matches LiquidityBucket. Otherwise the arrays are float64,
+#  orders of magnitude faster and close enough to explore with.
+#
+#  The two differ for a range over every tick, (0, size - 1). LiquidityBucket finds the wide snapshot under the same
+#  range and changes it once per tick, so its mLiq counts size times over. Here it is a range like any other.
+
+
+class LiquidityBucketArray(ILiquidity):
+    def __init__(self, size, sol_truncation=True, exact=True):
+        self.sol_truncation = sol_truncation
+        self.size: int = size
+        self.exact: bool = exact
+
+        # Plain Decimals in the arrays, UnsignedDecimal doesn't hand mixed operations on to NumPy.
+        # Snapshots still hold UnsignedDecimals, so ops are checked before any tick changes.
+        self._dtype = object if exact else np.float64
+        self._num = Decimal if exact else float
+
+        self._snapshots: Dict[Tuple[int, int], Snapshot] = {}
+        self._wide_snapshot = Snapshot(range=LiqRange(0, size - 1))
+
+        # Totals over the range snapshots of each tick, borrows per tick. The wide snapshot is added when read.
+        self._m_liq: np.ndarray = self._zeros()
+        self._t_liq: np.ndarray = self._zeros()
+        self._borrow_x: np.ndarray = self._zeros()
+        self._borrow_y: np.ndarray = self._zeros()
+        self._total_m_liq: np.ndarray = self._zeros()
+
+        # Fee rate each tick last accrued at, and its accumulated fee rates per mLiq
+        self._rate_x: np.ndarray = self._zeros()
+        self._rate_y: np.ndarray = self._zeros()
+        self._acc_x: np.ndarray = self._zeros()
+        self._acc_y: np.ndarray = self._zeros()
+
+        self.token_x_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
+        self.token_y_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
+
+    def _zeros(self) -> np.ndarray:
+        return np.full(self.size, self._num(0), dtype=self._dtype)
+
+    @staticmethod
+    def _ticks(liq_range: LiqRange) -> slice:
+        return slice(liq_range.low, liq_range.high + 1)
+
+    @staticmethod
+    def _first_tick(liq_range: LiqRange) -> slice:
+        # LiquidityBucket accrues the first tick of a range before finding an op doesn't fit, so rejected ops do too
+        return slice(liq_range.low, liq_range.low + 1)
+
+    def add_m_liq(self, liq_range: LiqRange, liq: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal, UnsignedDecimal):
+        """Adds mLiq to the provided range. Liquidity provided is per tick. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
+
+        ticks: slice = self._ticks(liq_range)
+        self._accumulate_fees(ticks)
+
+        snap: Snapshot = self._snapshots.get((liq_range.low, liq_range.high))
+        if snap is None:
+            snap = Snapshot(range=liq_range.copy(), m_liq=liq)
+            self._snapshots[(liq_range.low, liq_range.high)] = snap
+        else:
+            snap.m_liq += liq
+        self._change(ticks, snap, m_liq=liq)
+
+        (min_m_liq, _) = self.query_min_m_liq_max_t_liq(liq_range)
+        (acc_rate_x, acc_rate_y) = self.query_accumulated_fee_rates(liq_range)
+        return min_m_liq, acc_rate_x, acc_rate_y
+
+    def remove_m_liq(self, liq_range: LiqRange, liq: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal, UnsignedDecimal):
+        """Removes mLiq from the provided range. Liquidity provided is per tick. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
+
+        snap: Snapshot = self._snapshots.get((liq_range.low, liq_range.high))
+        if snap is None:
+            raise LiquidityExceptionRemovingMoreMLiqThanExists()
+
+        ticks: slice = self._ticks(liq_range)
+        try:
+            m_liq = snap.m_liq - liq
+        except UnsignedDecimalIsSignedException:
+            self._accumulate_fees(self._first_tick(liq_range))
+            raise LiquidityExceptionRemovingMoreMLiqThanExists()
+        self._accumulate_fees(ticks)
+
+        snap.m_liq = m_liq
+        self._change(ticks, snap, m_liq=liq, removing=True)
+
+        (min_m_liq, _) = self.query_min_m_liq_max_t_liq(liq_range)
+        (acc_rate_x, acc_rate_y) = self.query_accumulated_fee_rates(liq_range)
+        return min_m_liq, acc_rate_x, acc_rate_y
+
+    def add_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> UnsignedDecimal:
+        """Adds tLiq to the provided range. Liquidity provided is per tick. Borrowing given amounts. Returns the max tLiq."""
+
+        snap: Snapshot = self._snapshots.get((liq_range.low, liq_range.high))
+        if snap is None:
+            raise LiquidityExceptionTLiqExceedsMLiq()
+
+        ticks: slice = self._ticks(liq_range)
+        try:
+            t_liq, borrow_x, borrow_y = snap.t_liq + liq, snap.borrow_x + amount_x, snap.borrow_y + amount_y
+        except UnsignedDecimalIsSignedException:
+            self._accumulate_fees(self._first_tick(liq_range))
+            raise LiquidityExceptionTLiqExceedsMLiq()
+        self._accumulate_fees(ticks)
+
+        snap.t_liq, snap.borrow_x, snap.borrow_y = t_liq, borrow_x, borrow_y
+        self._change(ticks, snap, t_liq=liq, borrow_x=amount_x, borrow_y=amount_y)
+
+        (_, max_t_liq) = self.query_min_m_liq_max_t_liq(liq_range)
+        return max_t_liq
+
+    def remove_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> UnsignedDecimal:
+        """Removes tLiq to the provided range. Liquidity provided is per tick. Repaying given amounts. Returns the max tLiq."""
+
+        snap: Snapshot = self._snapshots.get((liq_range.low, liq_range.high))
+        if snap is None:
+            raise LiquidityExceptionRemovingMoreTLiqThanExists()
+
+        ticks: slice = self._ticks(liq_range)
+        try:
+            t_liq, borrow_x, borrow_y = snap.t_liq - liq, snap.borrow_x - amount_x, snap.borrow_y - amount_y
+        except UnsignedDecimalIsSignedException:
+            self._accumulate_fees(self._first_tick(liq_range))
+            raise
+        self._accumulate_fees(ticks)
+
+        snap.t_liq, snap.borrow_x, snap.borrow_y = t_liq, borrow_x, borrow_y
+        self._change(ticks, snap, t_liq=liq, borrow_x=amount_x, borrow_y=amount_y, removing=True)
+
+    # Wide ops only change the shared wide snapshot. Same as LiquidityBucket, the ticks accrue the change lazily.
+
+    def add_wide_m_liq(self, liq: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal, UnsignedDecimal):
+        """Adds mLiq over the wide range. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
+
+        self._wide_snapshot.m_liq += liq
+
+        (min_m_liq, _) = self.query_wide_min_m_liq_max_t_liq()
+        (acc_rate_x, acc_rate_y) = self.query_wide_accumulated_fee_rates()
+        return min_m_liq, acc_rate_x, acc_rate_y
+
+    def remove_wide_m_liq(self, liq: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal, UnsignedDecimal):
+        """Removes mLiq over the wide range. Returns the min mLiq, and accumulated fee rates per mLiq for each token."""
+
+        self._wide_snapshot.m_liq -= liq
+
+        (min_m_liq, _) = self.query_wide_min_m_liq_max_t_liq()
+        (acc_rate_x, acc_rate_y) = self.query_wide_accumulated_fee_rates()
+        return min_m_liq, acc_rate_x, acc_rate_y
+
+    def add_wide_t_liq(self, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> UnsignedDecimal:
+        """Adds tLiq over the wide range. Borrowing given amounts. Returns the max tLiq."""
+
+        self._wide_snapshot.t_liq += liq
+        self._wide_snapshot.borrow_x += amount_x
+        self._wide_snapshot.borrow_y += amount_y
+
+    def remove_wide_t_liq(self, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> UnsignedDecimal:
+        """Removes tLiq over the wide range. Repaying given amounts. Returns the max tLiq."""
+
+        self._wide_snapshot.t_liq -= liq
+        self._wide_snapshot.borrow_x -= amount_x
+        self._wide_snapshot.borrow_y -= amount_y
+
+    def query_min_m_liq_max_t_liq(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is per tick."""
+
+        ticks: slice = self._ticks(liq_range)
+        min_m_liq = (self._m_liq[ticks] + self._num(self._wide_snapshot.m_liq)).min()
+        max_t_liq = max((self._t_liq[ticks] + self._num(self._wide_snapshot.t_liq)).max(), self._num(0))
+        return min_m_liq, max_t_liq
+
+    def query_wide_min_m_liq_max_t_liq(self) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is for all tick."""
+
+        wide_t_liq = self._num(self._wide_snapshot.t_liq)
+        return self._num(self._wide_snapshot.m_liq), max((self._t_liq + wide_t_liq).max(), wide_t_liq)
+
+    def query_accumulated_fee_rates(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the accumulated fee rates per mLiq for each token over the provided range."""
+
+        ticks: slice = self._ticks(liq_range)
+        self._accumulate_fees(ticks)
+        return self._acc_x[ticks].sum(), self._acc_y[ticks].sum()
+
+    def query_wide_accumulated_fee_rates(self) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the accumulated fee rates per mLiq for each token over the wide range."""
+
+        ticks: slice = slice(0, self.size)
+        self._accumulate_fees(ticks)
+        return self._acc_x.sum(), self._acc_y.sum()
+
+    def _change(self, ticks: slice, snap: Snapshot, m_liq=0, t_liq=0, borrow_x=0, borrow_y=0, removing: bool = False) -> None:
+        """Spreads a change to a range snapshot over the totals of its ticks, same increments as Bucket.change."""
+        width: UnsignedDecimal = snap.width()
+        changes = (
+            (self._m_liq, m_liq),
+            (self._t_liq, t_liq),
+            (self._borrow_x, UnsignedDecimal(borrow_x) / width),
+            (self._borrow_y, UnsignedDecimal(borrow_y) / width),
+            (self._total_m_liq, m_liq * width),
+        )
+        for column, amount in changes:
+            if amount == 0:
+                continue
+            if removing:
+                column[ticks] -= self._num(amount)
+            else:
+                column[ticks] += self._num(amount)
+
+    def _accumulate_fees(self, ticks: slice) -> None:
+        wide: Snapshot = self._wide_snapshot
+
+        rate_x = self._num(self.token_x_fee_rate_snapshot)
+        rate_y = self._num(self.token_y_fee_rate_snapshot)
+        diff_x: np.ndarray = rate_x - self._rate_x[ticks]
+        diff_y: np.ndarray = rate_y - self._rate_y[ticks]
+        self._rate_x[ticks] = rate_x
+        self._rate_y[ticks] = rate_y
+
+        # Ticks without mLiq earn nothing, their rates are still brought up to date
+        total_m_liq: np.ndarray = self._total_m_liq[ticks] + self._num(wide.total_m_liq())
+        earning: np.ndarray = np.nonzero(total_m_liq != 0)[0]
+        if len(earning) == 0:
+            return
+
+        total_m_liq = total_m_liq[earning]
+        borrow_x: np.ndarray = self._borrow_x[ticks][earning] + self._num(wide.borrow_x / wide.width())
+        borrow_y: np.ndarray = self._borrow_y[ticks][earning] + self._num(wide.borrow_y / wide.width())
+
+        earning += ticks.start
+        self._acc_x[earning] += borrow_x * diff_x[earning - ticks.start] / total_m_liq
+        self._acc_y[earning] += borrow_y * diff_y[earning - ticks.start] / total_m_liq
@@ -2,6 +2,7 @@ from Bucket.LiquidityBucket import LiquidityBucket
 from FloatingPoint.FloatingPointTestCase import FloatingPointTestCase
 from FloatingPoint.UnsignedDecimal import UnsignedDecimal
 from ILiquidity import *
+from LiquidityExceptions import *
 
 
 class TestLiquidityBucket(FloatingPointTestCase):
@@ -1183,6 +1184,107 @@ class TestLiquidityBucket(FloatingPointTestCase):
 
     # endregion
 
+    # region Snapshot Index
+
+    def test_snapshots_are_indexed_by_range(self):
+        self.liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+        self.liq_bucket.add_m_liq(LiqRange(4, 5), UnsignedDecimal("10"))
+        self.liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("25"))
+        self.liq_bucket.remove_m_liq(LiqRange(4, 5), UnsignedDecimal("4"))
+
+        # The wide range and each distinct range once
+        bucket = self.liq_bucket._buckets[4]
+        self.assertEqual(len(bucket.snapshots), 3)
+        self.assertEqual(bucket.snapshot(LiqRange(2, 9)).m_liq, UnsignedDecimal("75"))
+        self.assertEqual(bucket.snapshot(LiqRange(4, 5)).m_liq, UnsignedDecimal("6"))
+        self.assertIsNone(bucket.snapshot(LiqRange(4, 6)))
+        self.assertEqual(self.liq_bucket.query_min_m_liq_max_t_liq(LiqRange(2, 9)), (UnsignedDecimal("75"), UnsignedDecimal("0")))
+
+    def test_bucket_totals_follow_snapshots(self):
+        self.liq_bucket.add_wide_m_liq(UnsignedDecimal("160"))
+        self.liq_bucket.add_wide_t_liq(UnsignedDecimal("16"), UnsignedDecimal("32"), UnsignedDecimal("48"))
+        self.liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+        self.liq_bucket.add_m_liq(LiqRange(4, 6), UnsignedDecimal("30"))
+        self.liq_bucket.add_t_liq(LiqRange(2, 9), UnsignedDecimal("20"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+        self.liq_bucket.add_t_liq(LiqRange(4, 6), UnsignedDecimal("10"), UnsignedDecimal("300"), UnsignedDecimal("30"))
+        self.liq_bucket.remove_t_liq(LiqRange(2, 9), UnsignedDecimal("5"), UnsignedDecimal("400"), UnsignedDecimal("40"))
+        self.liq_bucket.remove_m_liq(LiqRange(4, 6), UnsignedDecimal("10"))
+
+        for bucket in self.liq_bucket._buckets:
+            self.assertEqual(bucket.m_liq(), sum([snap.m_liq for snap in bucket.snapshots]))
+            self.assertEqual(bucket.t_liq(), sum([snap.t_liq for snap in bucket.snapshots]))
+            self.assertEqual(bucket.borrow_x(), sum([snap.borrow_x / snap.width() for snap in bucket.snapshots]))
+            self.assertEqual(bucket.borrow_y(), sum([snap.borrow_y / snap.width() for snap in bucket.snapshots]))
+            self.assertEqual(bucket.total_m_liq(), sum([snap.total_m_liq() for snap in bucket.snapshots]))
+
+        # 160 + 50 + 20 on a tick in both ranges, 2 + 50 + 100 borrowed per tick
+        self.assertEqual(self.liq_bucket._buckets[5].m_liq(), UnsignedDecimal("230"))
+        self.assertEqual(self.liq_bucket._buckets[5].borrow_x(), UnsignedDecimal("152"))
+
+    def test_remove_t_liq_without_snapshot(self):
+        self.liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+        self.liq_bucket.add_t_liq(LiqRange(2, 9), UnsignedDecimal("20"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+
+        self.assertRaises(LiquidityExceptionRemovingMoreTLiqThanExists, lambda: self.liq_bucket.remove_t_liq(LiqRange(2, 8), UnsignedDecimal("5"), UnsignedDecimal("1"), UnsignedDecimal("1")))
+        self.assertEqual(self.liq_bucket.query_min_m_liq_max_t_liq(LiqRange(2, 9)), (UnsignedDecimal("50"), UnsignedDecimal("20")))
+
+    def test_fee_query_only_accrues_queried_ticks(self):
+        self.liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("80"))
+        self.liq_bucket.add_t_liq(LiqRange(2, 9), UnsignedDecimal("40"), UnsignedDecimal("800"), UnsignedDecimal("160"))
+        self.liq_bucket.token_x_fee_rate_snapshot += UnsignedDecimal("64")
+        self.liq_bucket.token_y_fee_rate_snapshot += UnsignedDecimal("32")
+
+        # 100 borrowed x and 20 borrowed y per tick over a total mLiq of 640
+        self.assertEqual(self.liq_bucket.query_accumulated_fee_rates(LiqRange(4, 5)), (UnsignedDecimal("20"), UnsignedDecimal("2")))
+        self.assertEqual(self.liq_bucket._buckets[3].rate_x, UnsignedDecimal("0"))
+        self.assertEqual(self.liq_bucket._buckets[4].rate_x, UnsignedDecimal("64"))
+
+        # Accrued ticks are skipped, the rest catch up
+        self.assertEqual(self.liq_bucket.query_wide_accumulated_fee_rates(), (UnsignedDecimal("80"), UnsignedDecimal("8")))
+        self.assertEqual(self.liq_bucket.query_accumulated_fee_rates(LiqRange(4, 5)), (UnsignedDecimal("20"), UnsignedDecimal("2")))
+
+    # endregion
+
+    # region Sparse Buckets
+
+    def test_sparse_matches_dense(self):
+        sparse_bucket = LiquidityBucket(size=16, sparse=True)
+        for liq_bucket in (self.liq_bucket, sparse_bucket):
+            liq_bucket.add_wide_m_liq(UnsignedDecimal("100"))
+            liq_bucket.add_wide_t_liq(UnsignedDecimal("10"), UnsignedDecimal("1600"), UnsignedDecimal("160"))
+            liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+            liq_bucket.add_t_liq(LiqRange(2, 9), UnsignedDecimal("20"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+            liq_bucket.token_x_fee_rate_snapshot += UnsignedDecimal("1000")
+            liq_bucket.token_y_fee_rate_snapshot += UnsignedDecimal("500")
+            liq_bucket.query_accumulated_fee_rates(LiqRange(8, 12))
+            liq_bucket.add_wide_m_liq(UnsignedDecimal("60"))
+            liq_bucket.token_x_fee_rate_snapshot += UnsignedDecimal("300")
+
+        for liq_range in (LiqRange(0, 15), LiqRange(0, 1), LiqRange(4, 11), LiqRange(13, 14)):
+            self.assertEqual(sparse_bucket.query_min_m_liq_max_t_liq(liq_range), self.liq_bucket.query_min_m_liq_max_t_liq(liq_range))
+            for (sparse_rate, dense_rate) in zip(sparse_bucket.query_accumulated_fee_rates(liq_range), self.liq_bucket.query_accumulated_fee_rates(liq_range)):
+                self.assertFloatingPointEqual(sparse_rate, dense_rate)
+        self.assertEqual(sparse_bucket.query_wide_min_m_liq_max_t_liq(), self.liq_bucket.query_wide_min_m_liq_max_t_liq())
+        for (sparse_rate, dense_rate) in zip(sparse_bucket.query_wide_accumulated_fee_rates(), self.liq_bucket.query_wide_accumulated_fee_rates()):
+            self.assertFloatingPointEqual(sparse_rate, dense_rate)
+
+    def test_sparse_only_keeps_touched_ticks(self):
+        liq_bucket = LiquidityBucket(size=1 << 24, sparse=True)
+        liq_bucket.add_wide_m_liq(UnsignedDecimal("100"))
+        liq_bucket.add_m_liq(LiqRange(1000, 1003), UnsignedDecimal("10"))
+        self.assertEqual(len(liq_bucket._buckets), 4)
+
+        # Untouched ticks are read without being kept, until they have fees to accrue
+        self.assertEqual(liq_bucket.query_min_m_liq_max_t_liq(LiqRange(998, 1001)), (UnsignedDecimal("100"), UnsignedDecimal("0")))
+        liq_bucket.query_accumulated_fee_rates(LiqRange(990, 1009))
+        self.assertEqual(len(liq_bucket._buckets), 4)
+
+        liq_bucket.token_x_fee_rate_snapshot += UnsignedDecimal("1")
+        liq_bucket.query_accumulated_fee_rates(LiqRange(998, 999))
+        self.assertEqual(len(liq_bucket._buckets), 6)
+
+    # endregion
+
     #
     # # tLiq
     # def test_add_t_liq(self):
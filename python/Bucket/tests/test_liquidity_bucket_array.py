@@ -0,0 +1,106 @@
+import random
+from unittest import TestCase, skipIf
+
+from Bucket.LiquidityBucket import LiquidityBucket
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+from ILiquidity import *
+from LiquidityExceptions import *
+
+try:
+    from Bucket.LiquidityBucketArray import LiquidityBucketArray
+except ImportError:
+    LiquidityBucketArray = None
+
+
+@skipIf(LiquidityBucketArray is None, "NumPy is not installed")
+class TestLiquidityBucketArray(TestCase):
+
+    def _run(self, seed: int, liquidities, steps: int = 300):
+        """Applies the same random ops to every liquidity, returning the query results of each after every step."""
+        rand = random.Random(seed)
+        size: int = 32
+        # The root range is left out, the two differ there, see test_root_range_differs_from_bucket
+        ranges = [LiqRange(low, rand.randrange(low, size - 1)) for low in (rand.randrange(size - 1) for _ in range(12))]
+        results = [[] for _ in liquidities]
+
+        for _ in range(steps):
+            liq_range: LiqRange = rand.choice(ranges)
+            amount = UnsignedDecimal(rand.randrange(1, 50))
+            op: int = rand.randrange(7)
+            fee_rate = UnsignedDecimal(rand.randrange(1 << 64))
+
+            for idx, liquidity in enumerate(liquidities):
+                try:
+                    if op == 0:
+                        liquidity.add_m_liq(liq_range, amount * 10)
+                    elif op == 1:
+                        liquidity.remove_m_liq(liq_range, amount)
+                    elif op == 2:
+                        liquidity.add_t_liq(liq_range, amount, amount * 7, amount * 3)
+                    elif op == 3:
+                        liquidity.remove_t_liq(liq_range, amount, amount * 7, amount * 3)
+                    elif op == 4:
+                        liquidity.add_wide_m_liq(amount)
+                    elif op == 5:
+                        liquidity.token_x_fee_rate_snapshot += fee_rate
+                        liquidity.token_y_fee_rate_snapshot += fee_rate / 3
+                    else:
+                        liquidity.add_wide_t_liq(amount, amount * 11, amount)
+                    outcome = None
+                except Exception as e:
+                    outcome = type(e)
+
+                results[idx].append((
+                    outcome,
+                    liquidity.query_min_m_liq_max_t_liq(liq_range),
+                    liquidity.query_accumulated_fee_rates(liq_range),
+                    liquidity.query_wide_min_m_liq_max_t_liq(),
+                    liquidity.query_wide_accumulated_fee_rates(),
+                ))
+
+        return results
+
+    def test_exact_matches_bucket(self):
+        for seed in range(3):
+            (expected, actual) = self._run(seed, [LiquidityBucket(32), LiquidityBucketArray(32)])
+            for (expected_step, actual_step) in zip(expected, actual):
+                self.assertEqual(actual_step[0], expected_step[0])
+                for (expected_values, actual_values) in zip(expected_step[1:], actual_step[1:]):
+                    for (e, a) in zip(expected_values, actual_values):
+                        self.assertAlmostEqual(a, e, delta=abs(e) * UnsignedDecimal("1e-40"))
+
+    def test_float_close_to_bucket(self):
+        (expected, actual) = self._run(11, [LiquidityBucket(32), LiquidityBucketArray(32, exact=False)])
+        for (expected_step, actual_step) in zip(expected, actual):
+            self.assertEqual(actual_step[0], expected_step[0])
+            for (expected_values, actual_values) in zip(expected_step[1:], actual_step[1:]):
+                for (e, a) in zip(expected_values, actual_values):
+                    self.assertAlmostEqual(float(a), float(e), delta=abs(float(e)) * 1e-9)
+
+    def test_rejected_op_leaves_ticks_unchanged(self):
+        liq_bucket = LiquidityBucketArray(16)
+        liq_bucket.add_m_liq(LiqRange(2, 9), UnsignedDecimal(10))
+
+        with self.assertRaises(LiquidityExceptionRemovingMoreMLiqThanExists):
+            liq_bucket.remove_m_liq(LiqRange(2, 9), UnsignedDecimal(11))
+        with self.assertRaises(LiquidityExceptionTLiqExceedsMLiq):
+            liq_bucket.add_t_liq(LiqRange(2, 8), UnsignedDecimal(1), UnsignedDecimal(1), UnsignedDecimal(1))
+        with self.assertRaises(LiquidityExceptionRemovingMoreTLiqThanExists):
+            liq_bucket.remove_t_liq(LiqRange(2, 8), UnsignedDecimal(1), UnsignedDecimal(1), UnsignedDecimal(1))
+
+        self.assertEqual(liq_bucket.query_min_m_liq_max_t_liq(LiqRange(2, 9)), (10, 0))
+        self.assertEqual(liq_bucket.query_min_m_liq_max_t_liq(LiqRange(0, 1)), (0, 0))
+
+    def test_root_range_differs_from_bucket(self):
+        liq_bucket = LiquidityBucket(8)
+        liq_bucket_array = LiquidityBucketArray(8)
+        for liquidity in (liq_bucket, liq_bucket_array):
+            liquidity.add_m_liq(LiqRange(0, 7), UnsignedDecimal(100))
+            liquidity.add_m_liq(LiqRange(2, 5), UnsignedDecimal(50))
+            liquidity.add_wide_m_liq(UnsignedDecimal(7))
+
+        # LiquidityBucket adds the root range to the wide snapshot once per tick
+        self.assertEqual(liq_bucket.query_min_m_liq_max_t_liq(LiqRange(3, 3)), (857, 0))
+        self.assertEqual(liq_bucket.query_wide_min_m_liq_max_t_liq(), (807, 0))
+        self.assertEqual(liq_bucket_array.query_min_m_liq_max_t_liq(LiqRange(3, 3)), (157, 0))
+        self.assertEqual(liq_bucket_array.query_wide_min_m_liq_max_t_liq(), (7, 0))
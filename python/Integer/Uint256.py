@@ -0,0 +1,60 @@
+# Solidity's uint256 range
+UINT256_MAX: int = (1 << 256) - 1
+
+
+class Uint256IsSignedException(Exception):
+    pass
+
+
+class Uint256OverflowException(Exception):
+    pass
+
+
+# Plain python ints are exact and much faster than 78 digit decimals, but they silently go negative.
+# A Uint256 is an amount that reverts like the EVM would when it is subtracted, or subtracted from, past zero.
+#
+# Only subtraction is checked, and the result of one is a plain int again.
+# This is deliberate, the values being subtracted are wrapped while the stored values stay plain ints,
+# so the hot path of additions and multiplications runs at native int speed.
+# As python prefers the reflected method of a subclass, plain_int - Uint256 is checked as well.
+# Multiplying or dividing a Uint256 keeps it a Uint256, so amounts derived from one stay checked.
+class Uint256(int):
+    __slots__ = ()
+
+    def __new__(cls, value=0):
+        self = int.__new__(cls, value)
+        if self < 0:
+            raise Uint256IsSignedException()
+        if self > UINT256_MAX:
+            raise Uint256OverflowException()
+        return self
+
+    def __sub__(self, other):
+        result = int.__sub__(self, other)
+        if result < 0:
+            raise Uint256IsSignedException()
+        return result
+
+    def __rsub__(self, other):
+        result = int.__rsub__(self, other)
+        if result < 0:
+            raise Uint256IsSignedException()
+        return result
+
+    def __mul__(self, other):
+        return Uint256(int.__mul__(self, other))
+
+    def __rmul__(self, other):
+        return Uint256(int.__rmul__(self, other))
+
+    def __floordiv__(self, other):
+        return Uint256(int.__floordiv__(self, other))
+
+
+def mul_div(m0: int, m1: int, denominator: int) -> int:
+    """Returns floor(m0 * m1 / denominator), same as Math.mulDiv in Solidity.
+    The intermediate product is exact, only the result has to fit in 256 bits."""
+    result: int = m0 * m1 // denominator
+    if result > UINT256_MAX:
+        raise Uint256OverflowException()
+    return result
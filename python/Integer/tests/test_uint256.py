@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from Integer.Uint256 import Uint256, Uint256IsSignedException, Uint256OverflowException, UINT256_MAX, mul_div
+
+
+class Uint256Tests(TestCase):
+    def test_construction_bounds(self):
+        self.assertEqual(Uint256(0), 0)
+        self.assertEqual(Uint256(UINT256_MAX), UINT256_MAX)
+        self.assertRaises(Uint256IsSignedException, lambda: Uint256(-1))
+        self.assertRaises(Uint256OverflowException, lambda: Uint256(UINT256_MAX + 1))
+
+    def test_subtraction_is_checked(self):
+        self.assertEqual(Uint256(10) - 10, 0)
+        self.assertEqual(10 - Uint256(3), 7)
+        self.assertRaises(Uint256IsSignedException, lambda: Uint256(10) - 11)
+        self.assertRaises(Uint256IsSignedException, lambda: 10 - Uint256(11))
+
+    def test_subtracting_from_plain_int_field(self):
+        balance: int = 100
+        balance -= Uint256(40)
+        self.assertEqual(balance, 60)
+        self.assertIs(type(balance), int)
+
+        def overdraw():
+            nonlocal balance
+            balance -= Uint256(61)
+
+        self.assertRaises(Uint256IsSignedException, overdraw)
+
+    def test_derived_amounts_stay_checked(self):
+        amount = Uint256(700) // 7 * 3
+        self.assertIsInstance(amount, Uint256)
+        self.assertRaises(Uint256IsSignedException, lambda: 299 - amount)
+        self.assertRaises(Uint256OverflowException, lambda: Uint256(UINT256_MAX) * 2)
+
+    def test_addition_returns_plain_int(self):
+        self.assertIs(type(Uint256(1) + 1), int)
+        self.assertIs(type(1 + Uint256(1)), int)
+
+    def test_mul_div(self):
+        self.assertEqual(mul_div(18, 2 ** 64, 6 << 64), 3)
+        self.assertEqual(mul_div(7, 3, 2), 10)
+        # The intermediate product may exceed 256 bits
+        self.assertEqual(mul_div(UINT256_MAX, UINT256_MAX, UINT256_MAX), UINT256_MAX)
+        self.assertRaises(Uint256OverflowException, lambda: mul_div(UINT256_MAX, 2, 1))
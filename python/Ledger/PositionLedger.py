@@ -0,0 +1,134 @@
+from typing import Dict, List, Optional, Tuple
+
+from ILiquidity import *
+
+
+#  Position Ledger
+#
+#  The tree and the bucket only return accumulated fee rates, and the two mean different things by them.
+#  The ledger turns them into the fees earned per mLiq held over a range, then a maker is owed its mLiq times
+#  how far that moved since it last settled, so the ledger keeps what each position entered at.
+#
+#      tree      each cover earns its subtree rate and the own rates above it per mLiq on each of its ticks,
+#                already divided by 2^64, so the covers are weighted by their widths
+#      bucket    each tick accrues its fees over the mLiq times width of every snapshot on it, not divided by
+#                2^64, so the summed rates of the range are scaled by its width
+#
+#  Positions are rows of one list per column, indexed by position id. Closed rows are reused by later positions.
+#  Settling queries each distinct range once, however many positions hold it, then works down the columns.
+
+
+class PositionLedger:
+
+    def __init__(self, liquidity: ILiquidity):
+        self.liquidity: ILiquidity = liquidity
+
+        # A wide position has no range, its low and high are None
+        self.lows: List[Optional[int]] = []
+        self.highs: List[Optional[int]] = []
+        self.m_liqs: List[UnsignedDecimal] = []
+        # Fees earned per mLiq held over the range when the position opened or last settled
+        self.entry_earned_x: List[UnsignedDecimal] = []
+        self.entry_earned_y: List[UnsignedDecimal] = []
+
+        self._open: bytearray = bytearray()
+        self._free: List[int] = []
+
+    def open(self, liq_range: Optional[LiqRange], m_liq: UnsignedDecimal) -> int:
+        """
+        Records a position of mLiq over the range, or the wide range given None, entering at the current fees earned.
+        Call it once the mLiq has been added. Returns the position id.
+        """
+        low, high = (None, None) if liq_range is None else (liq_range.low, liq_range.high)
+        earned_x, earned_y = self._query_earned({(low, high)})[(low, high)]
+
+        row: Tuple = (low, high, m_liq, earned_x, earned_y)
+        if self._free:
+            position: int = self._free.pop()
+            for column, value in zip(self._columns(), row):
+                column[position] = value
+            self._open[position] = 1
+        else:
+            position = len(self.lows)
+            for column, value in zip(self._columns(), row):
+                column.append(value)
+            self._open.append(1)
+        return position
+
+    def close(self, position: int) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the fees the position is owed for each token and frees its id."""
+        self._check_open(position)
+        owed_x, owed_y = self._owed([position], self._query_earned({(self.lows[position], self.highs[position])}))
+
+        self._open[position] = 0
+        self._free.append(position)
+        return owed_x[0], owed_y[0]
+
+    def owed(self) -> (List[UnsignedDecimal], List[UnsignedDecimal]):
+        """The fees owed to every position for each token, indexed by position id. Closed ids are owed 0."""
+        positions: List[int] = self.positions()
+        return self._owed_by_id(positions, self._owed(positions, self._query_earned(self._ranges(positions))))
+
+    def settle(self) -> (List[UnsignedDecimal], List[UnsignedDecimal]):
+        """Same as owed, then moves every position's entry up to the current fees earned so the fees are not owed twice."""
+        positions: List[int] = self.positions()
+        earned: Dict[tuple, tuple] = self._query_earned(self._ranges(positions))
+        owed = self._owed_by_id(positions, self._owed(positions, earned))
+
+        for position in positions:
+            self.entry_earned_x[position], self.entry_earned_y[position] = earned[(self.lows[position], self.highs[position])]
+        return owed
+
+    def positions(self) -> List[int]:
+        """The ids of every open position."""
+        return [position for position, is_open in enumerate(self._open) if is_open]
+
+    def _columns(self) -> Tuple[List, ...]:
+        return self.lows, self.highs, self.m_liqs, self.entry_earned_x, self.entry_earned_y
+
+    def _check_open(self, position: int) -> None:
+        if not 0 <= position < len(self._open) or not self._open[position]:
+            raise KeyError(position)
+
+    def _ranges(self, positions: List[int]) -> set:
+        return {(self.lows[position], self.highs[position]) for position in positions}
+
+    def _query_earned(self, ranges: set) -> Dict[tuple, tuple]:
+        """The current fees earned per mLiq held over each distinct (low, high), with (None, None) for the wide range."""
+        earned: Dict[tuple, tuple] = {}
+        bounds: List[tuple] = [bound for bound in ranges if bound != (None, None)]
+        liq_ranges: List[LiqRange] = [LiqRange(low, high) for low, high in bounds]
+
+        # Only the tree answers many ranges at once, sharing the nodes above them
+        query_many = getattr(self.liquidity, "query_accumulated_fee_rates_many", None)
+        if query_many is not None:
+            if (None, None) in ranges:
+                # The root is the only cover of the wide range
+                rate_x, rate_y = self.liquidity.query_wide_accumulated_fee_rates()
+                earned[(None, None)] = (rate_x * self.liquidity.width, rate_y * self.liquidity.width)
+            earned.update(zip(bounds, query_many(liq_ranges, tick_weighted=True)))
+            return earned
+
+        if (None, None) in ranges:
+            earned[(None, None)] = self._bucket_earned(self.liquidity.query_wide_accumulated_fee_rates(), self.liquidity.size)
+        for bound, liq_range in zip(bounds, liq_ranges):
+            earned[bound] = self._bucket_earned(self.liquidity.query_accumulated_fee_rates(liq_range), liq_range.width())
+        return earned
+
+    @staticmethod
+    def _bucket_earned(rates: tuple, width: int) -> tuple:
+        rate_x, rate_y = rates
+        return rate_x * width / TWO_POW_SIXTY_FOUR, rate_y * width / TWO_POW_SIXTY_FOUR
+
+    def _owed(self, positions: List[int], earned: Dict[tuple, tuple]) -> (List[UnsignedDecimal], List[UnsignedDecimal]):
+        current: List[tuple] = [earned[(self.lows[position], self.highs[position])] for position in positions]
+        owed_x: List[UnsignedDecimal] = [self.m_liqs[position] * (earned_x - self.entry_earned_x[position]) for position, (earned_x, _) in zip(positions, current)]
+        owed_y: List[UnsignedDecimal] = [self.m_liqs[position] * (earned_y - self.entry_earned_y[position]) for position, (_, earned_y) in zip(positions, current)]
+        return owed_x, owed_y
+
+    def _owed_by_id(self, positions: List[int], owed: tuple) -> (List[UnsignedDecimal], List[UnsignedDecimal]):
+        owed_x: List[UnsignedDecimal] = [0] * len(self._open)
+        owed_y: List[UnsignedDecimal] = [0] * len(self._open)
+        for position, x, y in zip(positions, *owed):
+            owed_x[position], owed_y[position] = x, y
+        return owed_x, owed_y
@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+from Bucket.LiquidityBucket import LiquidityBucket
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+from Ledger.PositionLedger import PositionLedger
+from ILiquidity import TWO_POW_SIXTY_FOUR
+from Tree.LiquidityTree import LiquidityTree, LiqRange
+
+
+class TestPositionLedger(TestCase):
+
+    @staticmethod
+    def liquidities() -> list:
+        return [LiquidityTree(depth=4, sol_truncation=True), LiquidityBucket(size=16)]
+
+    @staticmethod
+    def accrue(liquidity, rate_x: int = 1000, rate_y: int = 2000) -> None:
+        """Moves the fee rates, each borrowed token then pays the given fee."""
+        liquidity.token_x_fee_rate_snapshot += UnsignedDecimal(rate_x) * TWO_POW_SIXTY_FOUR
+        liquidity.token_y_fee_rate_snapshot += UnsignedDecimal(rate_y) * TWO_POW_SIXTY_FOUR
+
+    def assertFees(self, owed: list, fees: int) -> None:
+        self.assertAlmostEqual(sum(owed), fees, delta=UnsignedDecimal("1e-30") * fees)
+
+    def test_lone_maker_earns_every_fee(self):
+        # The bucket only borrows against a range holding mLiq of its own
+        cases = [(liquidity, LiqRange(1, 6)) for liquidity in self.liquidities()] + [(LiquidityTree(depth=4, sol_truncation=True), LiqRange(2, 5))]
+        for (liquidity, borrowed) in cases:
+            ledger: PositionLedger = PositionLedger(liquidity)
+
+            liquidity.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+            position: int = ledger.open(LiqRange(1, 6), UnsignedDecimal("40"))
+            liquidity.add_t_liq(borrowed, UnsignedDecimal("30"), UnsignedDecimal("6000"), UnsignedDecimal("120"))
+            self.accrue(liquidity)
+
+            owed_x, owed_y = ledger.owed()
+            self.assertFees(owed_x, 6000 * 1000)
+            self.assertFees(owed_y, 120 * 2000)
+            self.assertEqual(ledger.close(position), (owed_x[position], owed_y[position]))
+
+    def test_lone_wide_maker_earns_every_fee(self):
+        for liquidity in self.liquidities():
+            ledger: PositionLedger = PositionLedger(liquidity)
+
+            liquidity.add_wide_m_liq(UnsignedDecimal("100"))
+            ledger.open(None, UnsignedDecimal("100"))
+            liquidity.add_wide_t_liq(UnsignedDecimal("30"), UnsignedDecimal("1600"), UnsignedDecimal("160"))
+            self.accrue(liquidity)
+
+            owed_x, owed_y = ledger.owed()
+            self.assertFees(owed_x, 1600 * 1000)
+            self.assertFees(owed_y, 160 * 2000)
+
+    def test_makers_split_fees_by_m_liq(self):
+        owed: list = []
+        for liquidity in self.liquidities():
+            ledger: PositionLedger = PositionLedger(liquidity)
+
+            liquidity.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+            first: int = ledger.open(LiqRange(1, 6), UnsignedDecimal("30"))
+            second: int = ledger.open(LiqRange(1, 6), UnsignedDecimal("10"))
+            liquidity.add_t_liq(LiqRange(1, 6), UnsignedDecimal("30"), UnsignedDecimal("6000"), UnsignedDecimal("120"))
+            self.accrue(liquidity)
+
+            owed_x, owed_y = ledger.owed()
+            self.assertFees(owed_x, 6000 * 1000)
+            self.assertFees(owed_y, 120 * 2000)
+            self.assertAlmostEqual(owed_x[first], 3 * owed_x[second], delta=UnsignedDecimal("1e-30") * owed_x[first])
+            owed.append((owed_x, owed_y))
+
+            # Settling leaves nothing owed until the rates move again
+            self.assertEqual(ledger.settle(), (owed_x, owed_y))
+            self.assertEqual(ledger.owed(), ([0] * 2, [0] * 2))
+
+        # The tree and the bucket owe the same fees
+        for (tree_owed, bucket_owed) in zip(*owed):
+            for (tree_fees, bucket_fees) in zip(tree_owed, bucket_owed):
+                self.assertAlmostEqual(tree_fees, bucket_fees, delta=UnsignedDecimal("1e-30") * bucket_fees)
+
+    def test_close_frees_the_position(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+        ledger: PositionLedger = PositionLedger(liq_tree)
+
+        liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        liq_tree.add_t_liq(LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("4000"), UnsignedDecimal("120"))
+        first: int = ledger.open(LiqRange(1, 6), UnsignedDecimal("20"))
+        second: int = ledger.open(LiqRange(1, 6), UnsignedDecimal("20"))
+        self.accrue(liq_tree)
+
+        owed_x, owed_y = ledger.owed()
+        self.assertEqual(ledger.close(first), (owed_x[first], owed_y[first]))
+        self.assertEqual(ledger.positions(), [second])
+        self.assertRaises(KeyError, lambda: ledger.close(first))
+
+        # The id is reused, entering at the current rates
+        self.assertEqual(ledger.open(LiqRange(3, 4), UnsignedDecimal("5")), first)
+        self.assertEqual(ledger.owed()[0][first], 0)
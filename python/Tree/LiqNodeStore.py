@@ -0,0 +1,380 @@
+import mmap
+import os
+import struct
+from collections.abc import Mapping, MutableMapping
+from copy import copy
+from dataclasses import fields
+from decimal import Decimal
+from typing import Dict, Iterator, List, Tuple
+
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+
+
+#  Dense Node Store
+#
+#  Every node of a tree with depth d is given a heap index, the root is 1 and the children of i are 2i and 2i + 1.
+#  An LKey already carries this index, (range << 24) | base with base = width + low, so the index is just base / range.
+#
+#                      1
+#              2               3
+#          4       5       6       7
+#        8   9   10  11  12  13  14  15        <- leaves, width + tick
+#
+#  Each node field is one list of length 2 * width indexed by heap index (a struct of arrays).
+#  Node fields can hold Decimals or ints wider than 64 bits, so plain lists are used over array.array.
+
+
+class DenseNodeStore(MutableMapping):
+    """
+    Drop in replacement for the defaultdict of LiqNodes, keyed by LKey.
+    Looking up a key returns a reference that reads and writes the columns in place.
+    """
+
+    def __init__(self, depth: int, prototype):
+        self.width: int = 1 << depth
+        self.size: int = self.width << 1
+        self._node_type = type(prototype)
+        self._ref_type = _ref_type(self._node_type)
+
+        self._zero: Dict = dict(vars(prototype))
+        self.columns: Dict[str, List] = {name: [value] * self.size for name, value in self._zero.items()}
+
+        # Nodes which have been looked up, same as the keys a defaultdict would hold
+        self._present: bytearray = bytearray(self.size)
+        self._count: int = 0
+
+    @staticmethod
+    def heap_index(key: int) -> int:
+        return (key & 0xFFFFFF) // (key >> 24)
+
+    def key_at(self, index: int) -> int:
+        range_: int = self.width >> (index.bit_length() - 1)
+        return range_ << 24 | index * range_
+
+    def column(self, name: str) -> List:
+        """The heap ordered values of one field, index 0 is unused."""
+        return self.columns[name]
+
+    def node(self, key: int):
+        """A detached copy of the node as the plain node type."""
+        index: int = self._index(key)
+        return self._node_type(**{name: column[index] for name, column in self.columns.items()})
+
+    def _index(self, key: int) -> int:
+        range_: int = key >> 24
+        index: int = (key & 0xFFFFFF) // range_ if range_ != 0 else 0
+        if index <= 0 or index >= self.size or (range_ << 24 | index * range_) != key or range_ != self.width >> (index.bit_length() - 1):
+            raise KeyError(key)
+        return index
+
+    def __getitem__(self, key: int):
+        index: int = self._index(key)
+        if not self._present[index]:
+            self._present[index] = 1
+            self._count += 1
+        return self._ref_type(self.columns, index)
+
+    def __setitem__(self, key: int, node) -> None:
+        ref = self[key]
+        for name in self.columns:
+            setattr(ref, name, getattr(node, name))
+
+    def __delitem__(self, key: int) -> None:
+        index: int = self._index(key)
+        if not self._present[index]:
+            raise KeyError(key)
+
+        self._present[index] = 0
+        self._count -= 1
+        for name, value in self._zero.items():
+            self.columns[name][index] = value
+
+    def __contains__(self, key) -> bool:
+        try:
+            return self._present[self._index(key)] != 0
+        except (KeyError, TypeError):
+            return False
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self) -> Iterator[int]:
+        present: bytearray = self._present
+        for index in range(1, self.size):
+            if present[index]:
+                yield self.key_at(index)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+#  Copy On Write Node Store
+#
+#  Forking a tree freezes its nodes into a read only layer shared by both sides.
+#  Each side then writes to its own dict, copying a node out of the shared layers the first time it is looked up,
+#  so a range op copies the O(depth) nodes on its path and everything else stays shared.
+#
+#      live  ->  own  ->  [frozen own, ..., original nodes]
+#      fork  ->  own  ->  [frozen own, ..., original nodes]
+#
+#  Forking again only adds a layer when the side being forked has written since, and the layers are
+#  flattened into one once there are more than FORK_LAYER_LIMIT of them.
+
+FORK_LAYER_LIMIT: int = 8
+
+# Marks a node deleted on this side while it is still held by a shared layer
+_DELETED = object()
+
+
+class CopyOnWriteNodeStore(MutableMapping):
+    """
+    Drop in replacement for the defaultdict of LiqNodes, layered over node mappings which are never written again.
+    Looking up a key returns a node owned by this store, get() and membership tests read the shared layers without copying.
+    """
+
+    def __init__(self, layers: Tuple[Mapping, ...], prototype):
+        self._layers: Tuple[Mapping, ...] = layers
+        self._own: Dict = {}
+        self._prototype = prototype
+        self._node_type = type(prototype)
+        self._fields: List[str] = [field.name for field in fields(prototype)]
+
+    @staticmethod
+    def freeze(nodes: Mapping) -> Tuple[Mapping, ...]:
+        """The layers to share between the sides of a fork. The given nodes must not be written after this."""
+        if not isinstance(nodes, CopyOnWriteNodeStore):
+            return nodes,
+
+        layers: Tuple[Mapping, ...] = ((nodes._own,) if nodes._own else ()) + nodes._layers
+        if len(layers) > FORK_LAYER_LIMIT:
+            flat: Dict = {}
+            for layer in reversed(layers):
+                for key, node in layer.items():
+                    if node is _DELETED:
+                        flat.pop(key, None)
+                    else:
+                        flat[key] = node
+            layers = flat,
+        return layers
+
+    def _shared(self, key: int):
+        for layer in self._layers:
+            node = layer.get(key)
+            if node is not None:
+                return None if node is _DELETED else node
+        return None
+
+    def _copy(self, node):
+        if type(node) is self._node_type:
+            return copy(node)
+        return self._node_type(**{name: getattr(node, name) for name in self._fields})
+
+    def __getitem__(self, key: int):
+        node = self._own.get(key)
+        if node is None or node is _DELETED:
+            shared = self._shared(key) if node is None else None
+            node = copy(self._prototype) if shared is None else self._copy(shared)
+            self._own[key] = node
+        return node
+
+    def __setitem__(self, key: int, node) -> None:
+        self._own[key] = node
+
+    def __delitem__(self, key: int) -> None:
+        if key not in self:
+            raise KeyError(key)
+
+        if self._shared(key) is None:
+            del self._own[key]
+        else:
+            self._own[key] = _DELETED
+
+    def get(self, key, default=None):
+        node = self._own.get(key)
+        if node is None:
+            node = self._shared(key)
+        return default if node is None or node is _DELETED else node
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        seen: set = set()
+        for layer in (self._own,) + self._layers:
+            for key, node in layer.items():
+                if key not in seen:
+                    seen.add(key)
+                    if node is not _DELETED:
+                        yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+#  Memory Mapped Node Store
+#
+#  The dense layout kept in a file instead of lists. Every heap index owns one fixed size record,
+#  so the heap index is the slot and the LKey to slot index costs nothing to hold.
+#
+#      header       magic, version, depth, record size, integer arithmetic          one page
+#      present      one byte per heap index, set once the node has been looked up    page aligned
+#      records      2 * width records, one field after another                       page aligned
+#
+#  The file is sparse, records of nodes never written are holes which read as zero and take no disk.
+#  The top levels sit in the first pages, so the page cache keeps the ones every traversal walks resident.
+#
+#  Integer fields are 32 byte two's complement, wide enough for a uint256.
+#  Decimal fields are a sign byte, a 4 byte exponent and a 35 byte coefficient, wide enough for the 78 digits of precision.
+#  The sign byte also flags a value whose type isn't the field's default, so values read back as the Decimal or
+#  UnsignedDecimal written, same as the other stores, and the unsigned checks fail in the same places.
+
+NODE_FILE_MAGIC: bytes = b"LIQNODES"
+NODE_FILE_VERSION: int = 2
+
+_NODE_FILE_HEADER = struct.Struct("<8sIIIB")  # magic, version, depth, record size, integer arithmetic
+_INT_FIELD_SIZE: int = 32
+_DECIMAL_FIELD_SIZE: int = 40
+_DECIMAL_COEFFICIENT_SIZE: int = 35
+_DECIMAL_OTHER_TYPE: int = 2
+
+
+class LiqNodeFileException(Exception):
+    pass
+
+
+def _page_aligned(offset: int) -> int:
+    return -(-offset // mmap.PAGESIZE) * mmap.PAGESIZE
+
+
+class _RecordField:
+    """One field of every record, indexed by heap index like the columns of DenseNodeStore."""
+
+    def __init__(self, view: memoryview, start: int, record_size: int, zero, integer_arithmetic: bool, signed: bool):
+        self._view: memoryview = view
+        self._start: int = start
+        self._record_size: int = record_size
+        self._unsigned: bool = isinstance(zero, UnsignedDecimal)
+        self._integer_arithmetic: bool = integer_arithmetic
+        self._signed: bool = signed
+
+    def __getitem__(self, index: int):
+        start: int = self._start + index * self._record_size
+        if self._integer_arithmetic:
+            return int.from_bytes(self._view[start:start + _INT_FIELD_SIZE], "little", signed=self._signed)
+
+        coefficient: int = int.from_bytes(self._view[start + 5:start + _DECIMAL_FIELD_SIZE], "little")
+        flags, exponent = struct.unpack_from("<Bi", self._view, start)
+        value: Decimal = Decimal((flags & 1, tuple(map(int, str(coefficient))), exponent))
+        if self._unsigned != bool(flags & _DECIMAL_OTHER_TYPE):
+            return UnsignedDecimal(value)
+        return value
+
+    def __setitem__(self, index: int, value) -> None:
+        start: int = self._start + index * self._record_size
+        if self._integer_arithmetic:
+            self._view[start:start + _INT_FIELD_SIZE] = int(value).to_bytes(_INT_FIELD_SIZE, "little", signed=self._signed)
+            return
+
+        sign, digits, exponent = value.as_tuple()
+        coefficient: int = int("".join(map(str, digits)))
+        flags: int = sign | (_DECIMAL_OTHER_TYPE if isinstance(value, UnsignedDecimal) != self._unsigned else 0)
+        struct.pack_into("<Bi", self._view, start, flags, exponent)
+        self._view[start + 5:start + _DECIMAL_FIELD_SIZE] = coefficient.to_bytes(_DECIMAL_COEFFICIENT_SIZE, "little")
+
+    def __len__(self) -> int:
+        return (len(self._view) - self._start) // self._record_size
+
+
+class MmapNodeStore(DenseNodeStore):
+    """
+    DenseNodeStore over a memory mapped file rather than lists, for trees whose nodes don't fit in memory.
+    An existing file of the same depth and number type is opened with its nodes, otherwise a new one is created.
+    """
+
+    def __init__(self, depth: int, prototype, path: str):
+        self.width: int = 1 << depth
+        self.size: int = self.width << 1
+        self._node_type = type(prototype)
+        self._ref_type = _ref_type(self._node_type)
+        self._zero: Dict = dict(vars(prototype))
+
+        integer_arithmetic: bool = not isinstance(next(iter(self._zero.values())), Decimal)
+        field_size: int = _INT_FIELD_SIZE if integer_arithmetic else _DECIMAL_FIELD_SIZE
+        record_size: int = field_size * len(self._zero)
+        present_start: int = mmap.PAGESIZE
+        records_start: int = _page_aligned(present_start + self.size)
+        file_size: int = records_start + self.size * record_size
+
+        header: bytes = _NODE_FILE_HEADER.pack(NODE_FILE_MAGIC, NODE_FILE_VERSION, depth, record_size, integer_arithmetic)
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.write(header)
+            self._file.truncate(file_size)
+        elif self._file.read(_NODE_FILE_HEADER.size) != header or os.fstat(self._file.fileno()).st_size != file_size:
+            self._file.close()
+            raise LiqNodeFileException("%s is not a node file for this tree" % path)
+
+        self._mmap: mmap.mmap = mmap.mmap(self._file.fileno(), file_size)
+        # Traversals jump between levels, reading ahead mostly pulls in nodes which aren't needed
+        if hasattr(mmap, "MADV_RANDOM"):
+            self._mmap.madvise(mmap.MADV_RANDOM)
+        self._view: memoryview = memoryview(self._mmap)
+        view: memoryview = self._view
+
+        # Signed fields are the ones declared as Decimal rather than UnsignedDecimal
+        signed: Dict[str, bool] = {field.name: field.type is Decimal for field in fields(prototype)}
+        self.columns: Dict[str, _RecordField] = {
+            name: _RecordField(view, records_start + idx * field_size, record_size, value, integer_arithmetic, signed[name])
+            for idx, (name, value) in enumerate(self._zero.items())
+        }
+
+        self._present: memoryview = view[present_start:present_start + self.size]
+        self._count: int = self.size - bytes(self._present).count(0)
+
+    def flush(self) -> None:
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self.columns.clear()
+        self._present.release()
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+_ref_types: Dict[type, type] = {}
+
+
+def _ref_type(node_type: type) -> type:
+    """
+    Builds a class with the same fields and methods as node_type where every field is a property
+    over the store columns. Node methods such as gap() work unchanged on the references.
+    """
+    if node_type in _ref_types:
+        return _ref_types[node_type]
+
+    def column_property(name: str) -> property:
+        def get(self):
+            return self._columns[name][self._index]
+
+        def set_(self, value):
+            self._columns[name][self._index] = value
+
+        return property(get, set_)
+
+    def init(self, columns: Dict[str, List], index: int):
+        self._columns = columns
+        self._index = index
+
+    def eq(self, other) -> bool:
+        names = [field.name for field in fields(node_type)]
+        return all(getattr(self, name) == getattr(other, name, None) for name in names)
+
+    namespace = {name: value for name, value in vars(node_type).items()
+                 if callable(value) and not name.startswith('__')}
+    namespace.update({field.name: column_property(field.name) for field in fields(node_type)})
+    namespace.update({'__slots__': ('_columns', '_index'), '__init__': init, '__eq__': eq, '__hash__': None})
+
+    ref_type: type = type(node_type.__name__ + 'Ref', (), namespace)
+    _ref_types[node_type] = ref_type
+    return ref_type
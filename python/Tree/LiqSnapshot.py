@@ -0,0 +1,209 @@
+import mmap
+import struct
+import sys
+from bisect import bisect_left
+from collections.abc import Mapping
+from dataclasses import fields
+from decimal import Decimal
+from typing import BinaryIO, Iterator, List, Tuple
+
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+from Tree.LiqNodeStore import CopyOnWriteNodeStore
+from Tree.LiquidityTree import LiquidityTree
+
+
+#  Liquidity Tree Snapshot
+#
+#  A tree saved as one little endian file, laid out so it can be mapped and read in place.
+#
+#      header       magic, version, flags, depth, node count, field count, tree fee rate snapshots
+#      fields       per LiqNode field its name, byte width, decimal exponent and whether it is signed
+#      keys         the LKeys of every node sorted ascending, 8 bytes each
+#      columns      per field one value for every key in key order, each value the field's byte width
+#
+#  Values are stored as integers. Integer trees store them as is, decimal trees scale a whole column by
+#  the smallest exponent in it so every value is an exact integer multiple of 10^exponent.
+#  The keys and every column start on an 8 byte boundary.
+#
+#  Loading maps the file and puts it under a CopyOnWriteNodeStore, so no node is decoded until it is first
+#  looked up and restarting costs the header rather than the size of the tree.
+
+SNAPSHOT_MAGIC: bytes = b"LIQTREE\0"
+SNAPSHOT_VERSION: int = 1
+
+_FLAG_INTEGER_ARITHMETIC: int = 1
+_FLAG_SOL_TRUNCATION: int = 2
+
+_HEADER = struct.Struct("<8sIIIQI")  # magic, version, flags, depth, node count, field count
+_FIELD = struct.Struct("<HiB")  # byte width, decimal exponent, signed
+_LENGTH = struct.Struct("<H")
+
+
+class LiqSnapshotFormatException(Exception):
+    pass
+
+
+class _Column:
+    __slots__ = ("name", "width", "exponent", "signed", "offset")
+
+    def __init__(self, name: str, width: int, exponent: int, signed: bool, offset: int = 0):
+        self.name = name
+        self.width = width
+        self.exponent = exponent
+        self.signed = signed
+        self.offset = offset
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _write_string(out: BinaryIO, value: str) -> None:
+    encoded: bytes = value.encode()
+    out.write(_LENGTH.pack(len(encoded)))
+    out.write(encoded)
+
+
+def _read_string(view: memoryview, offset: int) -> Tuple[str, int]:
+    length, = _LENGTH.unpack_from(view, offset)
+    offset += _LENGTH.size
+    return bytes(view[offset:offset + length]).decode(), offset + length
+
+
+def _encode_column(name: str, values: list, integer_arithmetic: bool) -> Tuple[_Column, List[int]]:
+    if integer_arithmetic:
+        exponent: int = 0
+        coefficients: List[int] = [int(value) for value in values]
+    else:
+        exponents: List[int] = [value.as_tuple().exponent for value in values if value != 0]
+        exponent = min(exponents) if exponents else 0
+        # Shifting the exponent leaves the digits alone, so the integer is exact
+        coefficients = [int(Decimal(value).scaleb(-exponent)) for value in values]
+
+    signed: bool = any(coefficient < 0 for coefficient in coefficients)
+    bits: int = max((coefficient.bit_length() for coefficient in coefficients), default=0) + signed
+    return _Column(name, max(1, (bits + 7) // 8), exponent, signed), coefficients
+
+
+def save_tree(liq_tree: LiquidityTree, path: str) -> None:
+    """Writes the tree to path. Any node store can be saved, nodes which were never created are not written."""
+    keys: List[int] = sorted(liq_tree.nodes)
+    nodes: list = [liq_tree.nodes.get(key) for key in keys]
+    names: List[str] = [field.name for field in fields(liq_tree._empty_node)]
+
+    columns: List[Tuple[_Column, List[int]]] = [
+        _encode_column(name, [getattr(node, name) for node in nodes], liq_tree.integer_arithmetic) for name in names
+    ]
+
+    flags: int = (_FLAG_INTEGER_ARITHMETIC if liq_tree.integer_arithmetic else 0) | (_FLAG_SOL_TRUNCATION if liq_tree.sol_truncation else 0)
+    with open(path, "wb") as out:
+        out.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, liq_tree.width.bit_length() - 1, len(keys), len(columns)))
+        _write_string(out, str(liq_tree.token_x_fee_rate_snapshot))
+        _write_string(out, str(liq_tree.token_y_fee_rate_snapshot))
+
+        for column, _ in columns:
+            _write_string(out, column.name)
+            out.write(_FIELD.pack(column.width, column.exponent, column.signed))
+
+        out.write(bytes(_aligned(out.tell()) - out.tell()))
+        out.write(struct.pack("<%dQ" % len(keys), *keys))
+
+        for column, coefficients in columns:
+            out.write(b"".join(coefficient.to_bytes(column.width, "little", signed=column.signed) for coefficient in coefficients))
+            out.write(bytes(_aligned(out.tell()) - out.tell()))
+
+
+def load_tree(path: str) -> LiquidityTree:
+    """Maps a saved tree. Nodes are read from the file on first lookup, and writes stay in memory."""
+    with open(path, "rb") as file:
+        view: memoryview = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    magic, version, flags, depth, count, field_count = _HEADER.unpack_from(view, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise LiqSnapshotFormatException("not a liquidity tree snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise LiqSnapshotFormatException("unsupported snapshot version %d" % version)
+
+    integer_arithmetic: bool = flags & _FLAG_INTEGER_ARITHMETIC != 0
+    liq_tree: LiquidityTree = LiquidityTree(depth, sol_truncation=flags & _FLAG_SOL_TRUNCATION != 0, integer_arithmetic=integer_arithmetic)
+
+    offset: int = _HEADER.size
+    token_x_fee_rate_snapshot, offset = _read_string(view, offset)
+    token_y_fee_rate_snapshot, offset = _read_string(view, offset)
+    number = int if integer_arithmetic else UnsignedDecimal
+    liq_tree.token_x_fee_rate_snapshot = number(token_x_fee_rate_snapshot)
+    liq_tree.token_y_fee_rate_snapshot = number(token_y_fee_rate_snapshot)
+
+    columns: List[_Column] = []
+    for _ in range(field_count):
+        name, offset = _read_string(view, offset)
+        width, exponent, signed = _FIELD.unpack_from(view, offset)
+        offset += _FIELD.size
+        columns.append(_Column(name, width, exponent, signed != 0))
+
+    keys_offset: int = _aligned(offset)
+    offset = keys_offset + 8 * count
+    for column in columns:
+        column.offset = offset
+        offset = _aligned(offset + column.width * count)
+
+    if offset > len(view):
+        raise LiqSnapshotFormatException("snapshot is truncated")
+
+    # Keys are read in place where the host shares the file's byte order
+    if sys.byteorder == "little":
+        keys = view[keys_offset:keys_offset + 8 * count].cast("Q")
+    else:
+        keys = list(struct.unpack_from("<%dQ" % count, view, keys_offset))
+
+    liq_tree.nodes = CopyOnWriteNodeStore((SnapshotNodes(view, keys, columns, liq_tree._empty_node, integer_arithmetic),), liq_tree._empty_node)
+    return liq_tree
+
+
+class SnapshotNodes(Mapping):
+    """Read only nodes of a mapped snapshot, decoded on every lookup. Lookups binary search the sorted keys."""
+
+    def __init__(self, view: memoryview, keys, columns: List[_Column], prototype, integer_arithmetic: bool):
+        self._view: memoryview = view
+        self._keys = keys
+        self._columns: List[_Column] = columns
+        self._prototype = prototype
+        self._node_type = type(prototype)
+        self._integer_arithmetic: bool = integer_arithmetic
+
+    def _value(self, column: _Column, index: int):
+        start: int = column.offset + index * column.width
+        coefficient: int = int.from_bytes(self._view[start:start + column.width], "little", signed=column.signed)
+        if self._integer_arithmetic:
+            return coefficient
+        if coefficient == 0:
+            return getattr(self._prototype, column.name)
+        return Decimal((0 if coefficient >= 0 else 1, tuple(map(int, str(abs(coefficient)))), column.exponent))
+
+    def _index(self, key) -> int:
+        index: int = bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            return -1
+        return index
+
+    def _node(self, index: int):
+        return self._node_type(**{column.name: self._value(column, index) for column in self._columns})
+
+    def __getitem__(self, key: int):
+        index: int = self._index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._node(index)
+
+    def get(self, key, default=None):
+        index: int = self._index(key)
+        return default if index < 0 else self._node(index)
+
+    def __contains__(self, key) -> bool:
+        return self._index(key) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -1,4 +1,30 @@
-from typing import Tuple
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Distinct (low, high, offset) ranges whose traversal plans are kept, least recently used are dropped first
+TRAVERSAL_PLAN_CACHE_SIZE: int = 4096
+
+
+class TraversalLeg(NamedTuple):
+    start: int
+    # Every key above start up to the root, the levels of the auxiliary mLiq array
+    ancestors: Tuple[int, ...]
+    # (key, None) visits a key covering the range, (up, sibling) propagates from a child into up
+    steps: Tuple[Tuple[int, Optional[int]], ...]
+
+
+class TraversalPlan(NamedTuple):
+    low: int
+    high: int
+    stop_range: int
+    legs: Tuple[TraversalLeg, ...]
+    # (up, sibling) from where the legs end up to the root
+    peak_steps: Tuple[Tuple[int, int], ...]
+    # The keys whose own liquidity changes for the range, and every key propagated into, in walk order
+    covers: Tuple[int, ...]
+    ancestors: Tuple[int, ...]
+    # Every key the walk looks up, siblings included, each once
+    touched: Tuple[int, ...]
 
 
 class LiquidityKey:
@@ -42,7 +68,123 @@ class LiquidityKey:
         raw_left = key - (child_range << 24)
         return raw_left, raw_left + child_range
 
+    @staticmethod
+    def ancestors(key: int, root: int) -> Tuple[int, ...]:
+        keys: list = []
+        while key != root:
+            key, _ = LiquidityKey.generic_up(key)
+            keys.append(key)
+        return tuple(keys)
+
+    # input is raw low, high
+    @staticmethod
+    def covers(low: int, high: int, offset: int) -> List[int]:
+        """
+        The keys covering the range, the same set as the covers of its traversal plan, without building or caching a plan.
+        Walks the levels bottom up, taking the node at either end whenever it is not shared with the neighbouring range.
+        """
+        keys: List[int] = []
+        low += offset
+        high += offset + 1
+        range_: int = 1
+        while low < high:
+            if low & range_:
+                keys.append(range_ << 24 | low)
+                low += range_
+            if high & range_:
+                high -= range_
+                keys.append(range_ << 24 | high)
+            range_ <<= 1
+        return keys
+
+    @staticmethod
+    def ancestors_of(keys: Iterable[int], root: int) -> List[int]:
+        """Every key above any of the given keys up to the root, each once, ascending so children come before their parents."""
+        found: set = set()
+        for key in keys:
+            while key != root:
+                key, _ = LiquidityKey.generic_up(key)
+                if key in found:
+                    break
+                found.add(key)
+        return sorted(found)
+
+    # input is raw low, high
+    @staticmethod
+    def decompose(low: int, high: int, offset: int) -> Iterator[Tuple[int, bool]]:
+        """
+        Yields (key, True) for each key covering the range, then (key, False) for each key whose subtree aggregates
+        depend on them, bottom up. These are the keys a range op writes, found without running it or caching a plan.
+        """
+        covers: List[int] = LiquidityKey.covers(low, high, offset)
+        for key in covers:
+            yield key, True
+        for key in LiquidityKey.ancestors_of(covers, offset << 24 | offset):
+            yield key, False
+
+    @staticmethod
+    def decompose_many(ranges: Iterable, offset: int) -> Iterator[Tuple[int, bool]]:
+        """
+        Same as decompose over many ranges, each given with a raw low and high such as LiqRange.
+        Every cover is yielded once, then every ancestor once, so shared ancestors are not repeated.
+        A key covering one range and above another is yielded as both.
+        """
+        covers: dict = {}
+        for liq_range in ranges:
+            covers.update(dict.fromkeys(LiquidityKey.covers(liq_range.low, liq_range.high, offset)))
+        for key in covers:
+            yield key, True
+        for key in LiquidityKey.ancestors_of(covers, offset << 24 | offset):
+            yield key, False
+
     # input is raw low, high
+    @staticmethod
+    @lru_cache(maxsize=TRAVERSAL_PLAN_CACHE_SIZE)
+    def traversal_plan(low: int, high: int, offset: int) -> TraversalPlan:
+        """
+        The keys a traversal of the range visits and propagates into, in order, same walk as _traverse in Solidity.
+        Plans only depend on the range and tree width, so they are cached and shared by every tree.
+        """
+        low, high, _, stop_range = LiquidityKey.keys(low, high, offset)
+        root: int = offset << 24 | offset
+
+        legs: list = []
+        current: int = root
+        # The low leg steps right up and visits right siblings, the high leg the mirror image
+        for start, up_step, is_inner, inner_sibling in (
+                (low, LiquidityKey.right_up, LiquidityKey.is_left, LiquidityKey.right_sibling),
+                (high, LiquidityKey.left_up, LiquidityKey.is_right, LiquidityKey.left_sibling)):
+            if start >= stop_range:
+                continue
+
+            current = start
+            steps: list = [(current, None)]
+            while current != root:
+                up, sibling = up_step(current)
+                steps.append((up, sibling))
+                current = up
+
+                if current >= stop_range:
+                    break
+
+                if is_inner(current):
+                    current = inner_sibling(current)
+                    steps.append((current, None))
+
+            legs.append(TraversalLeg(start, LiquidityKey.ancestors(start, root), tuple(steps)))
+
+        peak_steps: list = []
+        while current != root:
+            up, other = LiquidityKey.generic_up(current)
+            peak_steps.append((up, other))
+            current = up
+
+        covers: tuple = tuple(key for leg in legs for key, sibling in leg.steps if sibling is None)
+        ancestors: tuple = tuple(key for leg in legs for key, sibling in leg.steps if sibling is not None) + tuple(up for up, _ in peak_steps)
+        steps: list = [step for leg in legs for step in leg.steps] + peak_steps
+        touched: tuple = tuple(dict.fromkeys(key for step in steps for key in step if key is not None))
+        return TraversalPlan(low, high, stop_range, tuple(legs), tuple(peak_steps), covers, ancestors, touched)
+
     @staticmethod
     def keys(low: int, high: int, offset: int) -> Tuple[int, int, int, int]:  # low, high, peak, stop_range
         return LiquidityKey.range_bounds(low + offset, high + offset)
@@ -0,0 +1,141 @@
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+
+#  Liquidity Key Arrays
+#
+#  The same key math as LiquidityKey over NumPy uint64 arrays, one call for many ranges.
+#  Keys are (range << 24) | base with range <= 2^24 and base < 2^25, so they always fit in 64 bits.
+#  NumPy is only needed here, the trees themselves work on Python ints.
+
+
+_KEY = np.uint64
+
+
+class KeyTopology(NamedTuple):
+    """
+    Every key of a tree indexed by heap position, same layout as DenseNodeStore, the root is 1 and the children of i are 2i and 2i + 1.
+    Index 0 is unused. The root has no parent or sibling and the leaves no children, those entries are 0.
+    """
+    keys: np.ndarray
+    parents: np.ndarray
+    siblings: np.ndarray
+    lefts: np.ndarray
+    rights: np.ndarray
+
+    def level(self, level: int) -> slice:
+        """The heap positions of one level, level 0 is the root."""
+        return slice(1 << level, 2 << level)
+
+
+class LiquidityKeyArray:
+
+    @staticmethod
+    def lsb(x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=_KEY)
+        return x & (~x + _KEY(1))
+
+    @staticmethod
+    def low_key(low: np.ndarray) -> np.ndarray:
+        low = np.asarray(low, dtype=_KEY)
+        return LiquidityKeyArray.lsb(low) << _KEY(24) | low
+
+    @staticmethod
+    def high_key(high: np.ndarray) -> np.ndarray:
+        high = np.asarray(high, dtype=_KEY) + _KEY(1)
+        range_: np.ndarray = LiquidityKeyArray.lsb(high)
+        return range_ << _KEY(24) | high ^ range_
+
+    @staticmethod
+    def children(key: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        key = np.asarray(key, dtype=_KEY)
+        child_range: np.ndarray = key >> _KEY(25)
+        raw_left: np.ndarray = key - (child_range << _KEY(24))
+        return raw_left, raw_left + child_range
+
+    @staticmethod
+    def generic_up(key: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:  # up_key, other_key
+        key = np.asarray(key, dtype=_KEY)
+        range_: np.ndarray = key >> _KEY(24)
+        raw_other: np.ndarray = range_ ^ key
+        return np.minimum(raw_other, key) + (range_ << _KEY(24)), raw_other
+
+    # input is raw lows, highs
+    @staticmethod
+    def keys(low: np.ndarray, high: np.ndarray, offset: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:  # low, high, peak, stop_range
+        return LiquidityKeyArray.range_bounds(np.asarray(low, dtype=_KEY) + _KEY(offset), np.asarray(high, dtype=_KEY) + _KEY(offset))
+
+    # input is raw lows, highs with offset
+    @staticmethod
+    def range_bounds(range_low: np.ndarray, range_high: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:  # low, high, peak, limit_range
+        peak, peak_range = LiquidityKeyArray.lowest_common_ancestor(range_low, range_high)
+
+        low: np.ndarray = LiquidityKeyArray.low_key(range_low)
+        high: np.ndarray = LiquidityKeyArray.high_key(range_high)
+
+        is_low_below: np.ndarray = low < peak_range
+        is_high_below: np.ndarray = high < peak_range
+
+        # Same cases as LiquidityKey.range_bounds, both legs below stop under the peak,
+        # one leg below stops at the peak, neither below stops above it
+        stop_range: np.ndarray = np.where(
+            is_low_below & is_high_below,
+            peak_range >> _KEY(1),
+            np.where(is_low_below | is_high_below, peak_range, peak_range << _KEY(1)),
+        )
+        return low, high, peak, stop_range
+
+    @staticmethod
+    def lowest_common_ancestor(low: np.ndarray, high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:  # (peak, peak_range)
+        # Same binary search for the highest differing bit as LiquidityKey, with every branch taken per element
+        low = np.asarray(low, dtype=_KEY)
+        high = np.asarray(high, dtype=_KEY)
+
+        diff_mask: np.ndarray = np.full(low.shape, 0x00FFFFFF, dtype=_KEY)
+        diff_bits: np.ndarray = low ^ high
+
+        for test, shift in ((0xFFF000, 12), (0xFC0000, 6), (0xE00000, 3), (0xC00000, 2)):
+            is_clear: np.ndarray = diff_bits & _KEY(test) == 0
+            diff_mask = np.where(is_clear, diff_mask >> _KEY(shift), diff_mask)
+            diff_bits = np.where(is_clear, diff_bits << _KEY(shift), diff_bits)
+
+        diff_mask = np.where(diff_bits & _KEY(0x800000) == 0, diff_mask >> _KEY(1), diff_mask)
+
+        common_mask: np.ndarray = ~diff_mask
+        base: np.ndarray = common_mask & low
+        range_: np.ndarray = LiquidityKeyArray.lsb(common_mask)
+
+        return range_ << _KEY(24) | base, range_ << _KEY(24)
+
+    @staticmethod
+    def topology(depth: int) -> KeyTopology:
+        width: int = 1 << depth
+        index: np.ndarray = np.arange(2 * width, dtype=_KEY)
+
+        # Level of every heap position, position 0 is given the root level and cleared below
+        levels: np.ndarray = np.repeat(np.arange(depth + 1, dtype=_KEY), [1 << level for level in range(depth + 1)])
+        levels = np.concatenate(([_KEY(0)], levels))
+        ranges: np.ndarray = _KEY(width) >> levels
+
+        keys: np.ndarray = ranges << _KEY(24) | index * ranges
+        keys[0] = 0
+
+        parents, siblings = LiquidityKeyArray.generic_up(keys)
+        lefts, rights = LiquidityKeyArray.children(keys)
+
+        root: slice = slice(0, 2)
+        leaves: slice = slice(width, 2 * width)
+        parents[root] = 0
+        siblings[root] = 0
+        lefts[0] = rights[0] = 0
+        lefts[leaves] = 0
+        rights[leaves] = 0
+
+        return KeyTopology(keys, parents, siblings, lefts, rights)
+
+    @staticmethod
+    def to_keys(keys: np.ndarray) -> list:
+        """Python ints for use with LiquidityKey and the trees."""
+        return [int(key) for key in keys]
+
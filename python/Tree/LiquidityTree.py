@@ -1,8 +1,14 @@
-from collections import defaultdict
+import copy
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+from typing import Iterable, List, NamedTuple
 
+from FloatingPoint.UnsignedDecimal import UnsignedDecimalIsSignedException
 from ILiquidity import *
+from Integer.Uint256 import Uint256, Uint256IsSignedException, mul_div
 from LiquidityExceptions import *
-from Tree.LiquidityKey import LiquidityKey
+from Tree.LiqNodeStore import CopyOnWriteNodeStore, DenseNodeStore, MmapNodeStore
+from Tree.LiquidityKey import LiquidityKey, TraversalPlan
 
 
 #  Liquidity Tree
@@ -26,12 +32,42 @@ from Tree.LiquidityKey import LiquidityKey
 #      LLLL    LLLR    LLRL    LLRR   LRLL    LRLR   LRRL    LRRR      RLLL   RLLR   RLRL    RLRR   RRLL    RRLR   RRRL    RRRR
 
 
+_BATCH_CHANGES = {
+    "add_m_liq", "remove_m_liq", "add_t_liq", "remove_t_liq",
+    "add_wide_m_liq", "remove_wide_m_liq", "add_wide_t_liq", "remove_wide_t_liq",
+}
+
+_BATCH_REJECTIONS = (
+    LiquidityExceptionZeroLiquidity,
+    LiquidityExceptionRangeContainsNegative,
+    LiquidityExceptionRootRange,
+    LiquidityExceptionOversizedRange,
+    LiquidityExceptionRangeHighBelowLow,
+    LiquidityExceptionTLiqExceedsMLiq,
+    UnsignedDecimalIsSignedException,
+    Uint256IsSignedException,
+)
+
+# Distinct (query, low, high) results kept by a tree with query_cache, least recently used are dropped first
+QUERY_CACHE_SIZE: int = 4096
+
+
+def _signed(value):
+    """Drops the unsigned check from a value while keeping its numeric type."""
+    return int(value) if isinstance(value, int) else Decimal(value)
+
+
 @dataclass
 class LiqNode:
     m_liq: UnsignedDecimal = UnsignedDecimal(0)
     t_liq: UnsignedDecimal = UnsignedDecimal(0)
     subtree_m_liq: UnsignedDecimal = UnsignedDecimal(0)
 
+    # Per tick liquidity bounds over the subtree, relative to this node (ancestors are not included)
+    subtree_min_gap: Decimal = Decimal(0)
+    subtree_min_m_liq: UnsignedDecimal = UnsignedDecimal(0)
+    subtree_max_t_liq: UnsignedDecimal = UnsignedDecimal(0)
+
     token_x_borrow: UnsignedDecimal = UnsignedDecimal(0)
     token_x_subtree_borrow: UnsignedDecimal = UnsignedDecimal(0)
     token_x_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
@@ -44,6 +80,18 @@ class LiqNode:
     token_y_cumulative_earned_per_m_liq: UnsignedDecimal = UnsignedDecimal(0)
     token_y_cumulative_earned_per_m_subtree_liq: UnsignedDecimal = UnsignedDecimal(0)
 
+    def gap(self) -> Decimal:
+        # Signed, same as LiqNodeImpl.gap in Solidity
+        return _signed(self.m_liq) - _signed(self.t_liq)
+
+    @staticmethod
+    def uint256():
+        """Returns a node where every field is a plain integer."""
+        node: LiqNode = LiqNode()
+        for name in node.__dataclass_fields__:
+            setattr(node, name, 0)
+        return node
+
     # Can think of node in a tree as the combination key of (value, base)
     # ex. R is (1, 1) while LRR is (3, 2)
     # value is the nodes binary value. If in the tree 0 is prepended for a left traversal, and a 1 for a right traversal
@@ -56,20 +104,86 @@ class LiqNode:
     # right = None
 
 
+# Liquidity bounds of a leg which has not been walked, (min gap, min mLiq, max tLiq)
+_NO_BOUNDS = (Decimal("Infinity"), Decimal("Infinity"), Decimal("-Infinity"))
+
+
+@dataclass
+class _TraversalState:
+    """Carried through a traversal, same as State in Tree.sol. Each visit and propagate only uses the fields it needs."""
+    aux_m_liqs: List[UnsignedDecimal] = None
+    aux_idx: int = 0
+
+    m_liq: UnsignedDecimal = None
+    removing_m_liq: bool = False
+    t_liq: UnsignedDecimal = None
+    removing_t_liq: bool = False
+    x_per_tick: UnsignedDecimal = None
+    y_per_tick: UnsignedDecimal = None
+
+    acc_rate_x: UnsignedDecimal = None
+    acc_rate_y: UnsignedDecimal = None
+
+    # Liquidity bounds are tracked per leg, the low leg is backed up while walking the high leg
+    bounds: tuple = _NO_BOUNDS
+    bounds_backup: tuple = _NO_BOUNDS
+
+    def merge_bounds(self) -> None:
+        self.bounds = (min(self.bounds[0], self.bounds_backup[0]), min(self.bounds[1], self.bounds_backup[1]), max(self.bounds[2], self.bounds_backup[2]))
+        self.bounds_backup = _NO_BOUNDS
+
+
+class TickDistribution(NamedTuple):
+    """Per tick liquidity and borrow of a tree, index i holds tick i. Borrows are the share of each tick."""
+    m_liq: List[UnsignedDecimal]
+    t_liq: List[UnsignedDecimal]
+    borrow_x: List[UnsignedDecimal]
+    borrow_y: List[UnsignedDecimal]
+
+    def arrays(self, dtype=float) -> tuple:
+        """The same columns as NumPy arrays, floats by default as uint256 values don't fit any integer dtype."""
+        import numpy as np
+        return tuple(np.array(column, dtype=dtype) for column in self)
+
+
 class LiquidityTree(ILiquidity):
     # region Initialization
-    def __init__(self, depth: int, sol_truncation: bool = False):
+    def __init__(self, depth: int, sol_truncation: bool = False, integer_arithmetic: bool = False, dense_nodes: bool = False, node_file: str = None, compact_nodes: bool = False, query_cache: bool = False):
         self.sol_truncation = sol_truncation
 
-        self.root: LiqNode = LiqNode()
-        self.width = (1 << depth)
-        self.nodes = defaultdict(LiqNode)
+        # Range query results are kept until a node they read is written, see _cached_query.
+        # Writes bump the version of every node they change, tracked per LKey only while caching.
+        self._query_cache: OrderedDict = OrderedDict() if query_cache else None
+        self._versions: dict = {}
+
+        # Drop the nodes a change leaves empty, see compact
+        self.compact_nodes = compact_nodes
+
+        # Node fields are checked uint256 ints rather than decimals.
+        # Every division truncates the same as Tree.sol, so sol_truncation is implied.
+        self.integer_arithmetic = integer_arithmetic
+        self._num = Uint256 if integer_arithmetic else UnsignedDecimal
 
+        self.width = (1 << depth)
         self.root_key = (self.width << 24) | self.width
-        self.nodes[self.root_key] = self.root
 
-        self.token_x_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
-        self.token_y_fee_rate_snapshot: UnsignedDecimal = UnsignedDecimal(0)
+        # Node ranges as numbers, looked up by range rather than converted at every node
+        self._node_ranges: dict = {1 << level: self._num(1 << level) for level in range(depth + 1)}
+
+        # Nodes are either created on demand, or laid out as one column per field indexed by heap position.
+        # The dense store costs a fixed 2 * width slots per field, but no per node object or hashing.
+        # Given a node file, the same layout is kept in a memory mapped file instead of memory.
+        self._empty_node: LiqNode = LiqNode.uint256() if integer_arithmetic else LiqNode()
+        if node_file is not None:
+            self.nodes = MmapNodeStore(depth, self._empty_node, node_file)
+        elif dense_nodes:
+            self.nodes = DenseNodeStore(depth, self._empty_node)
+        else:
+            self.nodes = defaultdict(LiqNode.uint256 if integer_arithmetic else LiqNode)
+        self.nodes[self.root_key]
+
+        self.token_x_fee_rate_snapshot: UnsignedDecimal = 0 if integer_arithmetic else UnsignedDecimal(0)
+        self.token_y_fee_rate_snapshot: UnsignedDecimal = 0 if integer_arithmetic else UnsignedDecimal(0)
 
         # self._init_tree(self.root, None, 0, 0, depth)
 
@@ -94,478 +208,284 @@ class LiquidityTree(ILiquidity):
     #     self._init_tree(left, current, depth + 1, max_depth)
     #     self._init_tree(right, current, depth + 1, max_depth)
 
-    # endregion
-
-    # region Liquidity Limited Range Methods
-
-    def add_m_liq(self, liq_range: LiqRange, liq: UnsignedDecimal) -> None:
-        if liq == UnsignedDecimal("0"):
-            raise LiquidityExceptionZeroLiquidity()
-        if liq_range.low < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.high < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.low == UnsignedDecimal("0") and liq_range.high == UnsignedDecimal(self.width - 1):
-            raise LiquidityExceptionRootRange()
-        if liq_range.high >= UnsignedDecimal(self.width):
-            raise LiquidityExceptionOversizedRange()
-        if liq_range.high < liq_range.low:
-            raise LiquidityExceptionRangeHighBelowLow()
-
-        low, high, _, stop_range = LiquidityKey.keys(liq_range.low, liq_range.high, self.width)
-
-        current: int
-        node: LiqNode
-
-        if low < stop_range:
-            current = low
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            # Thought calculation was cool, might be useful in refactor
-            # m_liq_per_tick: int = liq * (self.width >> low_node.depth)
-            m_liq_per_tick: UnsignedDecimal = liq * UnsignedDecimal(current >> 24)
-            node.m_liq += liq
-            node.subtree_m_liq += m_liq_per_tick
-
-            # right propagate
-            current, _ = LiquidityKey.right_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.subtree_m_liq += m_liq_per_tick
-
-            while current < stop_range:
-                if LiquidityKey.is_left(current):
-                    current = LiquidityKey.right_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.m_liq += liq
-                    node.subtree_m_liq += liq * UnsignedDecimal(current >> 24)
-
-                # right propagate
-                up, left = LiquidityKey.right_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.subtree_m_liq = self.nodes[left].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-                current, node = up, parent
-
-        if high < stop_range:
-            current = high
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            m_liq_per_tick: UnsignedDecimal = liq * UnsignedDecimal(current >> 24)
-            node.m_liq += liq
-            node.subtree_m_liq += m_liq_per_tick
+    @property
+    def root(self) -> LiqNode:
+        # Looked up rather than held, a fork swaps the node store out from under the tree
+        return self.nodes[self.root_key]
+
+    def fork(self) -> 'LiquidityTree':
+        """
+        Returns an independent copy of the tree in O(1). Both trees keep reading the current nodes, and each copies
+        a node for itself the first time it looks it up, so an op copies only the nodes on its path.
+        Forks of a dense tree store their own nodes in dicts.
+        """
+        layers = CopyOnWriteNodeStore.freeze(self.nodes)
+
+        forked: LiquidityTree = copy.copy(self)
+        self.nodes = CopyOnWriteNodeStore(layers, self._empty_node)
+        forked.nodes = CopyOnWriteNodeStore(layers, self._empty_node)
+
+        # Cached results hold for both trees as of now, but each has to invalidate its own from here on
+        forked._versions = dict(self._versions)
+        if self._query_cache is not None:
+            forked._query_cache = OrderedDict(self._query_cache)
+        return forked
 
-            # left propagate
-            current, _ = LiquidityKey.left_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.subtree_m_liq += m_liq_per_tick
-
-            while current < stop_range:
-                if LiquidityKey.is_right(current):
-                    current = LiquidityKey.left_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.m_liq += liq
-                    node.subtree_m_liq += liq * UnsignedDecimal(current >> 24)
+    # endregion
 
-                # left propogate
-                up, right = LiquidityKey.left_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
+    # region Compaction
+
+    def compact(self) -> int:
+        """
+        Drops every node whose liquidity, borrow and subtree fields are all zero, and returns how many were dropped.
+        Such a node reads the same as one never created, apart from its fee snapshot and cumulative earned rates.
+        The snapshot is taken again the next time its fees are handled, which adds nothing while it has no borrow.
+        The earned rates only feed queries over ranges with no liquidity, as any node under or above a range
+        holding mLiq has subtree mLiq and is kept, so the rates of open positions don't move.
+        """
+        return self._compact_keys(list(self.nodes))
+
+    def _compact_keys(self, keys) -> int:
+        dropped: int = 0
+        for key in keys:
+            node: LiqNode = self.nodes.get(key)
+            if key != self.root_key and node is not None and self._is_empty(node):
+                del self.nodes[key]
+                dropped += 1
+                # A dropped node loses its earned rates, which queries over empty ranges read
+                self._bump_versions((key,))
+        return dropped
+
+    @staticmethod
+    def _is_empty(node: LiqNode) -> bool:
+        return (node.m_liq == 0 and node.t_liq == 0 and node.subtree_m_liq == 0
+                and node.subtree_min_gap == 0 and node.subtree_min_m_liq == 0 and node.subtree_max_t_liq == 0
+                and node.token_x_borrow == 0 and node.token_x_subtree_borrow == 0
+                and node.token_y_borrow == 0 and node.token_y_subtree_borrow == 0)
 
-                parent.subtree_m_liq = self.nodes[right].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-                current, node = up, parent
+    # endregion
 
-        node = self.nodes[current]
+    # region Liquidity Limited Range Methods
 
-        while current != self.root_key:
-            up, other = LiquidityKey.generic_up(current)
-            parent = self.nodes[up]
-            self.handle_fee(up, parent)
+    def add_m_liq(self, liq_range: LiqRange, liq: UnsignedDecimal) -> None:
+        self._check_range_args(liq_range, liq)
 
-            parent.subtree_m_liq = self.nodes[other].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-            current, node = up, parent
+        state: _TraversalState = _TraversalState(m_liq=self._amount(liq))
+        self._traverse(liq_range, (self._fee_visit, self._m_liq_visit), (self._fee_propagate, self._m_liq_propagate), state)
 
     def remove_m_liq(self, liq_range: LiqRange, liq: UnsignedDecimal) -> None:
-        if liq == UnsignedDecimal("0"):
-            raise LiquidityExceptionZeroLiquidity()
-        if liq_range.low < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.high < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.low == UnsignedDecimal("0") and liq_range.high == UnsignedDecimal(self.width - 1):
-            raise LiquidityExceptionRootRange()
-        if liq_range.high >= UnsignedDecimal(self.width):
-            raise LiquidityExceptionOversizedRange()
-        if liq_range.high < liq_range.low:
-            raise LiquidityExceptionRangeHighBelowLow()
-
-        low, high, _, stop_range = LiquidityKey.keys(liq_range.low, liq_range.high, self.width)
-
-        current: int
-        node: LiqNode
-
-        if low < stop_range:
-            current = low
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            # Thought calculation was cool, might be useful in refactor
-            # m_liq_per_tick: int = liq * (self.width >> low_node.depth)
-            m_liq_per_tick: UnsignedDecimal = liq * UnsignedDecimal(current >> 24)
-            node.m_liq -= liq
-            node.subtree_m_liq -= m_liq_per_tick
-
-            if node.t_liq > node.m_liq:
-                raise LiquidityExceptionTLiqExceedsMLiq()
-
-            # right propagate
-            current, _ = LiquidityKey.right_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.subtree_m_liq -= m_liq_per_tick
-
-            while current < stop_range:
-                if LiquidityKey.is_left(current):
-                    current = LiquidityKey.right_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
+        self._check_range_args(liq_range, liq)
 
-                    node.m_liq -= liq
-                    node.subtree_m_liq -= liq * UnsignedDecimal(current >> 24)
+        state: _TraversalState = _TraversalState(m_liq=self._amount(liq), removing_m_liq=True)
+        self._traverse(liq_range, (self._fee_visit, self._m_liq_visit, self._check_visit), (self._fee_propagate, self._m_liq_propagate), state)
 
-                    if node.t_liq > node.m_liq:
-                        raise LiquidityExceptionTLiqExceedsMLiq()
+    def add_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
+        self._check_range_args(liq_range, liq)
 
-                # right propagate
-                up, left = LiquidityKey.right_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
+        state: _TraversalState = _TraversalState(t_liq=self._amount(liq), x_per_tick=self._per_tick(amount_x, liq_range), y_per_tick=self._per_tick(amount_y, liq_range))
+        self._traverse(liq_range, (self._fee_visit, self._t_liq_visit, self._check_visit), (self._fee_propagate, self._t_liq_propagate), state)
 
-                parent.subtree_m_liq = self.nodes[left].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-                current, node = up, parent
+    def remove_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
+        self._check_range_args(liq_range, liq)
+
+        state: _TraversalState = _TraversalState(t_liq=self._amount(liq), x_per_tick=self._per_tick(amount_x, liq_range), y_per_tick=self._per_tick(amount_y, liq_range), removing_t_liq=True)
+        self._traverse(liq_range, (self._fee_visit, self._t_liq_visit), (self._fee_propagate, self._t_liq_propagate), state)
+
+    def update_range(self, liq_range: LiqRange, m_liq: Decimal = 0, t_liq: Decimal = 0, amount_x: Decimal = 0, amount_y: Decimal = 0) -> (UnsignedDecimal, UnsignedDecimal):
+        """
+        Changes the mLiq and tLiq of a range in one traversal, then returns its accumulated fee rates per mLiq for each token.
+        Liquidity is signed, negative values remove. The amounts are added or repaid along with the tLiq, so should be given with its sign.
+        Same result as the single range ops followed by query_accumulated_fee_rates, but opening a taker walks the tree once instead of three times.
+        """
+        self._check_range_args(liq_range, m_liq or t_liq)
+
+        state: _TraversalState = _TraversalState(acc_rate_x=self._num(0), acc_rate_y=self._num(0))
+        visits: list = [self._fee_visit]
+        propagates: list = [self._fee_propagate]
+
+        if m_liq != 0:
+            state.m_liq, state.removing_m_liq = self._num(abs(m_liq)), m_liq < 0
+            visits.append(self._m_liq_visit)
+            propagates.append(self._m_liq_propagate)
+        if t_liq != 0:
+            state.t_liq, state.removing_t_liq = self._num(abs(t_liq)), t_liq < 0
+            state.x_per_tick = self._per_tick(self._num(abs(amount_x)), liq_range)
+            state.y_per_tick = self._per_tick(self._num(abs(amount_y)), liq_range)
+            visits.append(self._t_liq_visit)
+            propagates.append(self._t_liq_propagate)
+
+        # Checked once both changes are in, so closing a maker and taker together can't trip on the order
+        if state.removing_m_liq or (t_liq != 0 and not state.removing_t_liq):
+            visits.append(self._check_visit)
+
+        visits.append(self._earn_visit)
+        propagates.append(self._earn_propagate)
+
+        self._traverse(liq_range, visits, propagates, state)
+        return state.acc_rate_x, state.acc_rate_y
 
-        if high < stop_range:
-            current = high
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+    # endregion
 
-            m_liq_per_tick: UnsignedDecimal = liq * UnsignedDecimal(current >> 24)
+    # region Traversal
+
+    def _traverse(self, liq_range: LiqRange, visits, propagates, state: '_TraversalState', view: bool = False) -> '_TraversalState':
+        """
+        Walks the low leg, the high leg and then up to the root, same as _traverse and _traverseView in Solidity.
+        Each visit is called as visit(key, node, state) on the nodes covering the range, and each propagate as
+        propagate(sibling, node, up, parent, state) on every ancestor after its covered child. Several visits and
+        propagates run in order at every node, so one walk can carry several operations.
+        A view traversal reads nodes without creating them.
+        The keys to walk come from the cached plan of the range, only the nodes are looked up per call.
+        """
+        node_at = self._view_node if view else self.nodes.__getitem__
+        plan: TraversalPlan = LiquidityKey.traversal_plan(liq_range.low, liq_range.high, self.width)
+
+        # Before walking, a change rejected partway still leaves the nodes it wrote
+        if not view:
+            self._bump_versions(plan.covers + plan.ancestors)
+
+        node: LiqNode = None
+        for leg in plan.legs:
+            if leg.start == plan.high:
+                # Now we're on the other leg so we swap the liquidity trackers
+                state.bounds, state.bounds_backup = state.bounds_backup, state.bounds
+
+            state.aux_m_liqs = self._aux_array(leg.ancestors)
+            state.aux_idx = 0
+            node = self._traverse_steps(leg.steps, node, node_at, visits, propagates, state)
+
+        # Both legs are handled, merge their liquidity trackers before touching up everything above
+        state.merge_bounds()
+
+        self._traverse_steps(plan.peak_steps, node, node_at, visits, propagates, state)
+
+        if self.compact_nodes and not view:
+            self._compact_keys(plan.touched)
+        return state
+
+    @staticmethod
+    def _traverse_steps(steps, node: LiqNode, node_at, visits, propagates, state: '_TraversalState') -> LiqNode:
+        for key, sibling_key in steps:
+            if sibling_key is None:
+                node = node_at(key)
+                for visit in visits:
+                    visit(key, node, state)
+            else:
+                parent = node_at(key)
+                sibling = node_at(sibling_key)
+                state.aux_idx += 1
+                for propagate in propagates:
+                    propagate(sibling, node, key, parent, state)
+                node = parent
+        return node
+
+    def _fee_visit(self, key: int, node: LiqNode, state: '_TraversalState') -> None:
+        self.handle_fee(key, node, state.aux_m_liqs[state.aux_idx])
+
+    def _fee_propagate(self, sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        self.handle_fee(up, parent, state.aux_m_liqs[state.aux_idx])
+
+    def _m_liq_visit(self, key: int, node: LiqNode, state: '_TraversalState') -> None:
+        liq: UnsignedDecimal = state.m_liq
+        m_liq_per_tick: UnsignedDecimal = liq * self._node_ranges[key >> 24]
+
+        if state.removing_m_liq:
             node.m_liq -= liq
+            node.subtree_min_gap -= _signed(liq)
+            node.subtree_min_m_liq -= liq
             node.subtree_m_liq -= m_liq_per_tick
+        else:
+            node.m_liq += liq
+            node.subtree_min_gap += _signed(liq)
+            node.subtree_min_m_liq += liq
+            node.subtree_m_liq += m_liq_per_tick
 
-            if node.t_liq > node.m_liq:
-                raise LiquidityExceptionTLiqExceedsMLiq()
-
-            # left propagate
-            current, _ = LiquidityKey.left_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.subtree_m_liq -= m_liq_per_tick
-
-            while current < stop_range:
-                if LiquidityKey.is_right(current):
-                    current = LiquidityKey.left_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.m_liq -= liq
-                    node.subtree_m_liq -= liq * UnsignedDecimal(current >> 24)
-
-                    if node.t_liq > node.m_liq:
-                        raise LiquidityExceptionTLiqExceedsMLiq()
-
-                # left propogate
-                up, right = LiquidityKey.left_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.subtree_m_liq = self.nodes[right].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-                current, node = up, parent
-
-        node = self.nodes[current]
-
-        while current != self.root_key:
-            up, other = LiquidityKey.generic_up(current)
-            parent = self.nodes[up]
-            self.handle_fee(up, parent)
-
-            parent.subtree_m_liq = self.nodes[other].subtree_m_liq + node.subtree_m_liq + parent.m_liq * UnsignedDecimal(up >> 24)
-            current, node = up, parent
-
-    def add_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
-        if liq == UnsignedDecimal("0"):
-            raise LiquidityExceptionZeroLiquidity()
-        if liq_range.low < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.high < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.low == UnsignedDecimal("0") and liq_range.high == UnsignedDecimal(self.width - 1):
-            raise LiquidityExceptionRootRange()
-        if liq_range.high >= UnsignedDecimal(self.width):
-            raise LiquidityExceptionOversizedRange()
-        if liq_range.high < liq_range.low:
-            raise LiquidityExceptionRangeHighBelowLow()
-
-        low, high, _, stop_range = LiquidityKey.keys(liq_range.low, liq_range.high, self.width)
-
-        current: int
-        node: LiqNode
-
-        if low < stop_range:
-            current = low
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            # Thought calculation was cool, might be useful in refactor
-            # m_liq_per_tick: int = liq * (self.width >> low_node.depth)
-            node.t_liq += liq
-
-            node_range: UnsignedDecimal = UnsignedDecimal(current >> 24)
-            node.token_x_borrow += amount_x / liq_range.width() * node_range
-            node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-            node.token_y_borrow += amount_y / liq_range.width() * node_range
-            node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-            if node.t_liq > node.m_liq:
-                raise LiquidityExceptionTLiqExceedsMLiq()
-
-            # right propagate
-            current, _ = LiquidityKey.right_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-            node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-            while current < stop_range:
-                if LiquidityKey.is_left(current):
-                    current = LiquidityKey.right_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.t_liq += liq
-
-                    node_range = UnsignedDecimal(current >> 24)
-                    node.token_x_borrow += amount_x / liq_range.width() * node_range
-                    node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-                    node.token_y_borrow += amount_y / liq_range.width() * node_range
-                    node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-                    if node.t_liq > node.m_liq:
-                        raise LiquidityExceptionTLiqExceedsMLiq()
-
-                # right propagate
-                up, left = LiquidityKey.right_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.token_x_subtree_borrow = self.nodes[left].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-                parent.token_y_subtree_borrow = self.nodes[left].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-                current, node = up, parent
-
-        if high < stop_range:
-            current = high
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.t_liq += liq
-
-            node_range: UnsignedDecimal = UnsignedDecimal(current >> 24)
-            node.token_x_borrow += amount_x / liq_range.width() * node_range
-            node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-            node.token_y_borrow += amount_y / liq_range.width() * node_range
-            node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-            if node.t_liq > node.m_liq:
-                raise LiquidityExceptionTLiqExceedsMLiq()
-
-            # left propagate
-            current, _ = LiquidityKey.left_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-            node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-            while current < stop_range:
-                if LiquidityKey.is_right(current):
-                    current = LiquidityKey.left_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.t_liq += liq
-
-                    node_range = UnsignedDecimal(current >> 24)
-                    node.token_x_borrow += amount_x / liq_range.width() * node_range
-                    node.token_x_subtree_borrow += amount_x / liq_range.width() * node_range
-                    node.token_y_borrow += amount_y / liq_range.width() * node_range
-                    node.token_y_subtree_borrow += amount_y / liq_range.width() * node_range
-
-                    if node.t_liq > node.m_liq:
-                        raise LiquidityExceptionTLiqExceedsMLiq()
-
-                # left propogate
-                up, right = LiquidityKey.left_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.token_x_subtree_borrow = self.nodes[right].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-                parent.token_y_subtree_borrow = self.nodes[right].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-                current, node = up, parent
-
-        node = self.nodes[current]
-
-        while current != self.root_key:
-            up, other = LiquidityKey.generic_up(current)
-            parent = self.nodes[up]
-            self.handle_fee(up, parent)
-
-            parent.token_x_subtree_borrow = self.nodes[other].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-            parent.token_y_subtree_borrow = self.nodes[other].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-            current, node = up, parent
-
-    def remove_t_liq(self, liq_range: LiqRange, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
-        if liq == UnsignedDecimal("0"):
-            raise LiquidityExceptionZeroLiquidity()
-        if liq_range.low < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.high < UnsignedDecimal("0"):
-            raise LiquidityExceptionRangeContainsNegative()
-        if liq_range.low == UnsignedDecimal("0") and liq_range.high == UnsignedDecimal(self.width - 1):
-            raise LiquidityExceptionRootRange()
-        if liq_range.high >= UnsignedDecimal(self.width):
-            raise LiquidityExceptionOversizedRange()
-        if liq_range.high < liq_range.low:
-            raise LiquidityExceptionRangeHighBelowLow()
-
-        low, high, _, stop_range = LiquidityKey.keys(liq_range.low, liq_range.high, self.width)
-
-        current: int
-        node: LiqNode
+    def _m_liq_propagate(self, sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        parent.subtree_m_liq = sibling.subtree_m_liq + node.subtree_m_liq + parent.m_liq * self._node_ranges[up >> 24]
+        self._propagate_liq_bounds(sibling, node, parent)
 
-        if low < stop_range:
-            current = low
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+    def _t_liq_visit(self, key: int, node: LiqNode, state: '_TraversalState') -> None:
+        liq: UnsignedDecimal = state.t_liq
+        node_range: UnsignedDecimal = self._node_ranges[key >> 24]
+        borrow_x: UnsignedDecimal = state.x_per_tick * node_range
+        borrow_y: UnsignedDecimal = state.y_per_tick * node_range
 
-            # Thought calculation was cool, might be useful in refactor
-            # m_liq_per_tick: int = liq * (self.width >> low_node.depth)
+        if state.removing_t_liq:
             node.t_liq = node.t_liq - liq
-
-            node_range: UnsignedDecimal = UnsignedDecimal(current >> 24)
-            node.token_x_borrow -= amount_x / liq_range.width() * node_range
-            node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-            node.token_y_borrow -= amount_y / liq_range.width() * node_range
-            node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-            # right propagate
-            current, _ = LiquidityKey.right_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-            node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-            while current < stop_range:
-                if LiquidityKey.is_left(current):
-                    current = LiquidityKey.right_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.t_liq -= liq
-
-                    node_range = UnsignedDecimal(current >> 24)
-                    node.token_x_borrow -= amount_x / liq_range.width() * node_range
-                    node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-                    node.token_y_borrow -= amount_y / liq_range.width() * node_range
-                    node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-                # right propagate
-                up, left = LiquidityKey.right_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.token_x_subtree_borrow = self.nodes[left].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-                parent.token_y_subtree_borrow = self.nodes[left].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-                current, node = up, parent
-
-        if high < stop_range:
-            current = high
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.t_liq -= liq
-
-            node_range: UnsignedDecimal = UnsignedDecimal(current >> 24)
-            node.token_x_borrow -= amount_x / liq_range.width() * node_range
-            node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-            node.token_y_borrow -= amount_y / liq_range.width() * node_range
-            node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-            # left propagate
-            current, _ = LiquidityKey.left_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
-
-            node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-            node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-            while current < stop_range:
-                if LiquidityKey.is_right(current):
-                    current = LiquidityKey.left_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
-
-                    node.t_liq -= liq
-
-                    node_range = UnsignedDecimal(current >> 24)
-                    node.token_x_borrow -= amount_x / liq_range.width() * node_range
-                    node.token_x_subtree_borrow -= amount_x / liq_range.width() * node_range
-                    node.token_y_borrow -= amount_y / liq_range.width() * node_range
-                    node.token_y_subtree_borrow -= amount_y / liq_range.width() * node_range
-
-                # left propogate
-                up, right = LiquidityKey.left_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-
-                parent.token_x_subtree_borrow = self.nodes[right].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-                parent.token_y_subtree_borrow = self.nodes[right].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-                current, node = up, parent
-
-        node = self.nodes[current]
-
-        while current != self.root_key:
-            up, other = LiquidityKey.generic_up(current)
-            parent = self.nodes[up]
-            self.handle_fee(up, parent)
-
-            parent.token_x_subtree_borrow = self.nodes[other].token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
-            parent.token_y_subtree_borrow = self.nodes[other].token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
-            current, node = up, parent
+            node.subtree_min_gap += _signed(liq)
+            node.subtree_max_t_liq -= liq
+            node.token_x_borrow -= borrow_x
+            node.token_x_subtree_borrow -= borrow_x
+            node.token_y_borrow -= borrow_y
+            node.token_y_subtree_borrow -= borrow_y
+        else:
+            node.t_liq += liq
+            node.subtree_min_gap -= _signed(liq)
+            node.subtree_max_t_liq += liq
+            node.token_x_borrow += borrow_x
+            node.token_x_subtree_borrow += borrow_x
+            node.token_y_borrow += borrow_y
+            node.token_y_subtree_borrow += borrow_y
+
+    def _t_liq_propagate(self, sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        parent.token_x_subtree_borrow = sibling.token_x_subtree_borrow + node.token_x_subtree_borrow + parent.token_x_borrow
+        parent.token_y_subtree_borrow = sibling.token_y_subtree_borrow + node.token_y_subtree_borrow + parent.token_y_borrow
+        self._propagate_liq_bounds(sibling, node, parent)
+
+    @staticmethod
+    def _check_visit(key: int, node: LiqNode, state: '_TraversalState') -> None:
+        if node.t_liq > node.m_liq:
+            raise LiquidityExceptionTLiqExceedsMLiq()
+
+    @staticmethod
+    def _earn_visit(key: int, node: LiqNode, state: '_TraversalState') -> None:
+        # Fees were just handled, so the cumulative rates are current
+        state.acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq
+        state.acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq
+
+    @staticmethod
+    def _earn_propagate(sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        state.acc_rate_x += parent.token_x_cumulative_earned_per_m_liq
+        state.acc_rate_y += parent.token_y_cumulative_earned_per_m_liq
+
+    def _view_earn_visit(self, key: int, node: LiqNode, state: '_TraversalState') -> None:
+        earned_x, earned_y = self._view_subtree_fee(key, node, state.aux_m_liqs[state.aux_idx])
+        state.acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq + earned_x
+        state.acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq + earned_y
+
+    def _view_earn_propagate(self, sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        earned_x, earned_y = self._view_fee(up, parent, state.aux_m_liqs[state.aux_idx])
+        state.acc_rate_x += parent.token_x_cumulative_earned_per_m_liq + earned_x
+        state.acc_rate_y += parent.token_y_cumulative_earned_per_m_liq + earned_y
+
+    @staticmethod
+    def _bounds_visit(key: int, node: LiqNode, state: '_TraversalState') -> None:
+        min_gap, min_m_liq, max_t_liq = state.bounds
+        state.bounds = (min(min_gap, node.subtree_min_gap), min(min_m_liq, node.subtree_min_m_liq), max(max_t_liq, node.subtree_max_t_liq))
+
+    @staticmethod
+    def _bounds_propagate(sibling: LiqNode, node: LiqNode, up: int, parent: LiqNode, state: '_TraversalState') -> None:
+        min_gap, min_m_liq, max_t_liq = state.bounds
+        state.bounds = (min_gap + parent.gap(), min_m_liq + parent.m_liq, max_t_liq + parent.t_liq)
 
     # endregion
 
-    def handle_fee(self, current: int, node: LiqNode):
+    def handle_fee(self, current: int, node: LiqNode, aux_level: UnsignedDecimal = None):
+        if self.integer_arithmetic:
+            if aux_level is None:
+                aux_level = self.auxiliary_level_m_liq(current)
+            self._handle_fee_uint256(node, node.subtree_m_liq + aux_level * (current >> 24))
+            return
+
         token_x_fee_rate_diff: UnsignedDecimal = self.token_x_fee_rate_snapshot - node.token_x_fee_rate_snapshot
         node.token_x_fee_rate_snapshot = self.token_x_fee_rate_snapshot
         token_y_fee_rate_diff: UnsignedDecimal = self.token_y_fee_rate_snapshot - node.token_y_fee_rate_snapshot
         node.token_y_fee_rate_snapshot = self.token_y_fee_rate_snapshot
 
-        aux_level: UnsignedDecimal = (0 if current == self.root_key else self.auxiliary_level_m_liq(current))
-        total_m_liq: UnsignedDecimal = node.subtree_m_liq + aux_level * UnsignedDecimal(current >> 24)
+        # Traversals pass in the precomputed suffix sum, otherwise walk to the root
+        if aux_level is None:
+            aux_level = (0 if current == self.root_key else self.auxiliary_level_m_liq(current))
+        total_m_liq: UnsignedDecimal = node.subtree_m_liq + aux_level * self._node_ranges[current >> 24]
 
         if total_m_liq <= 0:
             return
@@ -583,151 +503,568 @@ class LiquidityTree(ILiquidity):
             node.token_y_cumulative_earned_per_m_liq = UnsignedDecimal(int(node.token_y_cumulative_earned_per_m_liq))
             node.token_y_cumulative_earned_per_m_subtree_liq = UnsignedDecimal(int(node.token_y_cumulative_earned_per_m_subtree_liq))
 
-    def auxiliary_level_m_liq(self, node_key: int) -> UnsignedDecimal:
-        if node_key == self.root_key:
-            return UnsignedDecimal(0)
-
-        m_liq: UnsignedDecimal = UnsignedDecimal(0)
-        node_key, _ = LiquidityKey.generic_up(node_key)
-        while node_key < self.root_key:
-            m_liq += self.nodes[node_key].m_liq
-            node_key, _ = LiquidityKey.generic_up(node_key)
-
-        m_liq += self.root.m_liq
-        return m_liq
+    def _amount(self, amount: UnsignedDecimal) -> UnsignedDecimal:
+        # Wrapped so that removing more than exists reverts, the same as it would in Solidity
+        return Uint256(amount) if self.integer_arithmetic else amount
 
-    def query_min_m_liq_max_t_liq(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
-        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is per tick."""
-        raise NotImplementedError
+    def _per_tick(self, amount: UnsignedDecimal, liq_range: LiqRange) -> UnsignedDecimal:
+        if self.integer_arithmetic:
+            # Solidity divides the borrow over the range before spreading it over the nodes
+            return Uint256(amount) // liq_range.width()
+        return amount / liq_range.width()
 
-    def query_wide_min_m_liq_max_t_liq(self) -> (UnsignedDecimal, UnsignedDecimal):
-        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is for all tick."""
-        raise NotImplementedError
-
-    def query_accumulated_fee_rates(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
-        """Returns the accumulated fee rates per mLiq for each token over the provided range."""
-        acc_rate_x = acc_rate_y = UnsignedDecimal(0)
-
-        low, high, _, stop_range = LiquidityKey.keys(liq_range.low, liq_range.high, self.width)
+    def _handle_fee_uint256(self, node: LiqNode, total_m_liq: int):
+        # Same as _handleFee in Solidity
+        token_x_fee_rate_diff: int = Uint256(self.token_x_fee_rate_snapshot) - node.token_x_fee_rate_snapshot
+        node.token_x_fee_rate_snapshot = self.token_x_fee_rate_snapshot
+        token_y_fee_rate_diff: int = Uint256(self.token_y_fee_rate_snapshot) - node.token_y_fee_rate_snapshot
+        node.token_y_fee_rate_snapshot = self.token_y_fee_rate_snapshot
 
-        current: int
-        node: LiqNode
+        if total_m_liq <= 0:
+            return
 
-        if low < stop_range:
-            current = low
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+        # The fee rates are Q192.64, so the shift takes the earned rate back to a plain integer
+        denominator: int = total_m_liq << 64
+        node.token_x_cumulative_earned_per_m_liq += mul_div(node.token_x_borrow, token_x_fee_rate_diff, denominator)
+        node.token_x_cumulative_earned_per_m_subtree_liq += mul_div(node.token_x_subtree_borrow, token_x_fee_rate_diff, denominator)
 
-            acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq
-            acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq
+        node.token_y_cumulative_earned_per_m_liq += mul_div(node.token_y_borrow, token_y_fee_rate_diff, denominator)
+        node.token_y_cumulative_earned_per_m_subtree_liq += mul_div(node.token_y_subtree_borrow, token_y_fee_rate_diff, denominator)
 
-            # right propagate
-            current, _ = LiquidityKey.right_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+    def _view_node(self, key: int) -> LiqNode:
+        # Nodes that were never written are all zero, so a shared empty node stands in without creating them
+        return self.nodes.get(key, self._empty_node)
 
-            acc_rate_x += node.token_x_cumulative_earned_per_m_liq
-            acc_rate_y += node.token_y_cumulative_earned_per_m_liq
+    def _view_fee(self, current: int, node: LiqNode, aux_level: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal):
+        """The fees handle_fee would add to the node's cumulative earned per mLiq, same as _viewFee in Solidity."""
+        return self._view_earned(current, node, aux_level, node.token_x_borrow, node.token_y_borrow)
 
-            while current < stop_range:
-                if LiquidityKey.is_left(current):
-                    current = LiquidityKey.right_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
+    def _view_subtree_fee(self, current: int, node: LiqNode, aux_level: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal):
+        """The fees handle_fee would add to the node's cumulative earned per subtree mLiq, same as _viewSubtreeFee in Solidity."""
+        return self._view_earned(current, node, aux_level, node.token_x_subtree_borrow, node.token_y_subtree_borrow)
 
-                    acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq
-                    acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq
+    def _view_earned(self, current: int, node: LiqNode, aux_level: UnsignedDecimal, borrow_x: UnsignedDecimal, borrow_y: UnsignedDecimal) -> (UnsignedDecimal, UnsignedDecimal):
+        token_x_fee_rate_diff: UnsignedDecimal = self._num(self.token_x_fee_rate_snapshot) - node.token_x_fee_rate_snapshot
+        token_y_fee_rate_diff: UnsignedDecimal = self._num(self.token_y_fee_rate_snapshot) - node.token_y_fee_rate_snapshot
+        total_m_liq: UnsignedDecimal = node.subtree_m_liq + aux_level * self._node_ranges[current >> 24]
 
-                # right propagate
-                up, left = LiquidityKey.right_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-                current, node = up, parent
+        if total_m_liq <= 0:
+            return self._num(0), self._num(0)
 
-                acc_rate_x += node.token_x_cumulative_earned_per_m_liq
-                acc_rate_y += node.token_y_cumulative_earned_per_m_liq
+        if self.integer_arithmetic:
+            denominator: int = total_m_liq << 64
+            return mul_div(borrow_x, token_x_fee_rate_diff, denominator), mul_div(borrow_y, token_y_fee_rate_diff, denominator)
 
-        if high < stop_range:
-            current = high
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+        earned_x: UnsignedDecimal = borrow_x * token_x_fee_rate_diff / total_m_liq / TWO_POW_SIXTY_FOUR
+        earned_y: UnsignedDecimal = borrow_y * token_y_fee_rate_diff / total_m_liq / TWO_POW_SIXTY_FOUR
 
-            acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq
-            acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq
+        # Cumulative values are already whole when truncating, so truncating the earned part alone is equivalent
+        if self.sol_truncation:
+            return UnsignedDecimal(int(earned_x)), UnsignedDecimal(int(earned_y))
+        return earned_x, earned_y
 
-            # left propagate
-            current, _ = LiquidityKey.left_up(current)
-            node = self.nodes[current]
-            self.handle_fee(current, node)
+    def auxiliary_level_m_liq(self, node_key: int) -> UnsignedDecimal:
+        if node_key == self.root_key:
+            return self._num(0)
 
-            acc_rate_x += node.token_x_cumulative_earned_per_m_liq
-            acc_rate_y += node.token_y_cumulative_earned_per_m_liq
+        m_liq: UnsignedDecimal = self._num(0)
+        node_key, _ = LiquidityKey.generic_up(node_key)
+        while node_key < self.root_key:
+            m_liq += self._view_node(node_key).m_liq
+            node_key, _ = LiquidityKey.generic_up(node_key)
 
-            while current < stop_range:
-                if LiquidityKey.is_right(current):
-                    current = LiquidityKey.left_sibling(current)
-                    node = self.nodes[current]
-                    self.handle_fee(current, node)
+        m_liq += self._view_node(self.root_key).m_liq
+        return m_liq
 
-                    acc_rate_x += node.token_x_cumulative_earned_per_m_subtree_liq
-                    acc_rate_y += node.token_y_cumulative_earned_per_m_subtree_liq
+    def _compute_aux_array(self, start: int) -> List[UnsignedDecimal]:
+        """Precomputes the auxiliary mLiq for every level of a leg, same as computeAuxArray in Solidity.
+        Index 0 holds the auxiliary level of the start key, each following index is one level up, ending with 0 at the root."""
+        return self._aux_array(LiquidityKey.ancestors(start, self.root_key))
+
+    def _aux_array(self, ancestors) -> List[UnsignedDecimal]:
+        aux_m_liqs: List[UnsignedDecimal] = [self._view_node(key).m_liq for key in ancestors]
+
+        # The root has no auxiliary mLiq
+        aux_m_liqs.append(self._num(0))
+
+        # Iterate backwards collecting the previous mLiq into the partial suffix sums
+        suffix_sum: UnsignedDecimal = self._num(0)
+        for idx in range(len(aux_m_liqs) - 2, -1, -1):
+            suffix_sum += aux_m_liqs[idx]
+            aux_m_liqs[idx] = suffix_sum
+
+        return aux_m_liqs
+
+    @staticmethod
+    def _propagate_liq_bounds(left: LiqNode, right: LiqNode, parent: LiqNode) -> None:
+        parent.subtree_min_gap = min(left.subtree_min_gap, right.subtree_min_gap) + parent.gap()
+        parent.subtree_min_m_liq = min(left.subtree_min_m_liq, right.subtree_min_m_liq) + parent.m_liq
+        parent.subtree_max_t_liq = max(left.subtree_max_t_liq, right.subtree_max_t_liq) + parent.t_liq
+
+    def _bump_versions(self, keys) -> None:
+        if self._query_cache is not None:
+            versions: dict = self._versions
+            for key in keys:
+                versions[key] = versions.get(key, 0) + 1
+
+    def _cached_query(self, name: str, liq_range: LiqRange, query, fee_rates: bool = False):
+        """
+        Returns query(liq_range), reusing the result kept from an earlier call while it still holds.
+        A range query reads its covers and the keys above them, so the result holds while none of their versions moved,
+        and for fee rates while neither fee rate snapshot moved either.
+        """
+        if self._query_cache is None:
+            return query(liq_range)
+
+        plan: TraversalPlan = LiquidityKey.traversal_plan(liq_range.low, liq_range.high, self.width)
+        versions: tuple = tuple(self._versions.get(key, 0) for key in plan.covers + plan.ancestors)
+        if fee_rates:
+            versions += (self.token_x_fee_rate_snapshot, self.token_y_fee_rate_snapshot)
+
+        cache_key: tuple = (name, liq_range.low, liq_range.high)
+        entry = self._query_cache.get(cache_key)
+        if entry is not None and entry[0] == versions:
+            self._query_cache.move_to_end(cache_key)
+            return entry[1]
+
+        result = query(liq_range)
+        self._query_cache[cache_key] = (versions, result)
+        self._query_cache.move_to_end(cache_key)
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return result
 
-                # left propogate
-                up, right = LiquidityKey.left_up(current)
-                parent = self.nodes[up]
-                self.handle_fee(up, parent)
-                current, node = up, parent
+    def query_min_m_liq_max_t_liq(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is per tick."""
+        _, min_m_liq, max_t_liq = self._cached_query("bounds", liq_range, self._query_liq_bounds)
+        return min_m_liq, max_t_liq
 
-                acc_rate_x += node.token_x_cumulative_earned_per_m_liq
-                acc_rate_y += node.token_y_cumulative_earned_per_m_liq
+    def query_wide_min_m_liq_max_t_liq(self) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the min mLiq, max tLiq over the wide range. Returned liquidity is for all tick."""
+        root: LiqNode = self._view_node(self.root_key)
+        return root.subtree_min_m_liq, root.subtree_max_t_liq
 
-        node = self.nodes[current]
+    def query_liq_gap(self, liq_range: LiqRange) -> Decimal:
+        """Returns the min mLiq - tLiq over the provided range. Returned liquidity is per tick."""
+        liq_gap, _, _ = self._cached_query("bounds", liq_range, self._query_liq_bounds)
+        return liq_gap
 
-        while current != self.root_key:
-            up, other = LiquidityKey.generic_up(current)
-            parent = self.nodes[up]
-            self.handle_fee(up, parent)
-            current, node = up, parent
+    def query_wide_liq_gap(self) -> Decimal:
+        """Returns the min mLiq - tLiq over the wide range. Returned liquidity is per tick."""
+        return self._view_node(self.root_key).subtree_min_gap
 
-            acc_rate_x += node.token_x_cumulative_earned_per_m_liq
-            acc_rate_y += node.token_y_cumulative_earned_per_m_liq
+    def _query_liq_bounds(self, liq_range: LiqRange) -> (Decimal, UnsignedDecimal, UnsignedDecimal):
+        state: _TraversalState = self._traverse(liq_range, (self._bounds_visit,), (self._bounds_propagate,), _TraversalState(), view=True)
+        return state.bounds
 
-        return acc_rate_x, acc_rate_y
+    def query_accumulated_fee_rates(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
+        """Returns the accumulated fee rates per mLiq for each token over the provided range.
+        Same as queryEarnRates in Solidity, pending fees are viewed rather than settled so no node is written or created."""
+        return self._cached_query("fee_rates", liq_range, self._query_accumulated_fee_rates, fee_rates=True)
+
+    def _query_accumulated_fee_rates(self, liq_range: LiqRange) -> (UnsignedDecimal, UnsignedDecimal):
+        state: _TraversalState = _TraversalState(acc_rate_x=self._num(0), acc_rate_y=self._num(0))
+        self._traverse(liq_range, (self._view_earn_visit,), (self._view_earn_propagate,), state, view=True)
+        return state.acc_rate_x, state.acc_rate_y
+
+    def query_accumulated_fee_rates_many(self, ranges: Iterable[LiqRange], tick_weighted: bool = False) -> List[tuple]:
+        """
+        Returns query_accumulated_fee_rates of each range, in the order given, viewing the fees of each node once.
+        A range earns the subtree rates of its covers and the own rates of every key above them. Those keys are the
+        ancestors of its first and last cover, which meet at its peak, so with the own rates summed from the root down
+        to each key and kept, a range costs its covers and three lookups, however many ranges share the upper keys.
+
+        The rates are per mLiq on each tick of a node, so a maker holding mLiq over the range earns the rates of
+        each cover times its width. With tick_weighted, each cover's rates and the rates above it are weighted by its
+        width, giving the fees earned per mLiq held over the range.
+        """
+        aux_levels: dict = {self.root_key: self._num(0)}
+        # Own rates summed from the root down to the key, inclusive, per token
+        prefix_rates: dict = {}
+        subtree_rates: dict = {}
+        zero_rates: tuple = (self._num(0), self._num(0))
+
+        def aux_level(key: int) -> UnsignedDecimal:
+            if key not in aux_levels:
+                up, _ = LiquidityKey.generic_up(key)
+                aux_levels[key] = aux_level(up) + self._view_node(up).m_liq
+            return aux_levels[key]
+
+        def prefix_rate(key: int) -> tuple:
+            if key not in prefix_rates:
+                node: LiqNode = self._view_node(key)
+                earned_x, earned_y = self._view_fee(key, node, aux_level(key))
+                above_x, above_y = zero_rates if key == self.root_key else prefix_rate(LiquidityKey.generic_up(key)[0])
+                prefix_rates[key] = (above_x + node.token_x_cumulative_earned_per_m_liq + earned_x, above_y + node.token_y_cumulative_earned_per_m_liq + earned_y)
+            return prefix_rates[key]
+
+        def above_rate(key: int) -> tuple:
+            return zero_rates if key == self.root_key else prefix_rate(LiquidityKey.generic_up(key)[0])
+
+        def subtree_rate(key: int) -> tuple:
+            if key not in subtree_rates:
+                node: LiqNode = self._view_node(key)
+                earned_x, earned_y = self._view_subtree_fee(key, node, aux_level(key))
+                subtree_rates[key] = (node.token_x_cumulative_earned_per_m_subtree_liq + earned_x, node.token_y_cumulative_earned_per_m_subtree_liq + earned_y)
+            return subtree_rates[key]
+
+        results: dict = {}
+        rates: List[tuple] = []
+        for liq_range in ranges:
+            bounds: tuple = (liq_range.low, liq_range.high)
+            if bounds not in results:
+                covers: List[int] = sorted(LiquidityKey.covers(liq_range.low, liq_range.high, self.width), key=lambda key: key & 0xFFFFFF)
+
+                if tick_weighted:
+                    acc_rate_x, acc_rate_y = self._num(0), self._num(0)
+                    for key in covers:
+                        (cover_x, cover_y), (above_x, above_y) = subtree_rate(key), above_rate(key)
+                        acc_rate_x += (cover_x + above_x) * (key >> 24)
+                        acc_rate_y += (cover_y + above_y) * (key >> 24)
+                    results[bounds] = (acc_rate_x, acc_rate_y)
+                    rates.append(results[bounds])
+                    continue
+
+                acc_rate_x, acc_rate_y = above_rate(covers[0])
+                if len(covers) > 1:
+                    high_x, high_y = above_rate(covers[-1])
+                    peak, _ = LiquidityKey.lowest_common_ancestor(liq_range.low + self.width, liq_range.high + self.width)
+                    peak_x, peak_y = prefix_rate(peak)
+                    acc_rate_x, acc_rate_y = acc_rate_x + high_x - peak_x, acc_rate_y + high_y - peak_y
+
+                for key in covers:
+                    cover_x, cover_y = subtree_rate(key)
+                    acc_rate_x, acc_rate_y = acc_rate_x + cover_x, acc_rate_y + cover_y
+                results[bounds] = (acc_rate_x, acc_rate_y)
+            rates.append(results[bounds])
+        return rates
 
     def query_wide_accumulated_fee_rates(self) -> (UnsignedDecimal, UnsignedDecimal):
         """Returns the accumulated fee rates per mLiq for each token over the wide range."""
-        raise NotImplementedError
+        # The root covers every tick, so its subtree rates are the wide range rates
+        root: LiqNode = self._view_node(self.root_key)
+        earned_x, earned_y = self._view_subtree_fee(self.root_key, root, self._num(0))
+        return root.token_x_cumulative_earned_per_m_subtree_liq + earned_x, root.token_y_cumulative_earned_per_m_subtree_liq + earned_y
 
     # region Liquidity Wide Range Methods
 
     def add_wide_m_liq(self, liq: UnsignedDecimal) -> None:
+        liq = self._amount(liq)
+
         self.handle_fee(self.root_key, self.root)
+        self._bump_versions((self.root_key,))
 
         self.root.m_liq += liq
         self.root.subtree_m_liq += self.width * liq
+        self.root.subtree_min_gap += _signed(liq)
+        self.root.subtree_min_m_liq += liq
 
     def remove_wide_m_liq(self, liq: UnsignedDecimal) -> None:
+        liq = self._amount(liq)
+
         self.handle_fee(self.root_key, self.root)
+        self._bump_versions((self.root_key,))
 
         self.root.m_liq -= liq
         self.root.subtree_m_liq -= self.width * liq
+        self.root.subtree_min_gap -= _signed(liq)
+        self.root.subtree_min_m_liq -= liq
 
     def add_wide_t_liq(self, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
+        liq, amount_x, amount_y = self._amount(liq), self._amount(amount_x), self._amount(amount_y)
+
         self.handle_fee(self.root_key, self.root)
+        self._bump_versions((self.root_key,))
 
         self.root.t_liq += liq
+        self.root.subtree_min_gap -= _signed(liq)
+        self.root.subtree_max_t_liq += liq
         self.root.token_x_borrow += amount_x
         self.root.token_x_subtree_borrow += amount_x
         self.root.token_y_borrow += amount_y
         self.root.token_y_subtree_borrow += amount_y
 
     def remove_wide_t_liq(self, liq: UnsignedDecimal, amount_x: UnsignedDecimal, amount_y: UnsignedDecimal) -> None:
+        liq, amount_x, amount_y = self._amount(liq), self._amount(amount_x), self._amount(amount_y)
+
         self.handle_fee(self.root_key, self.root)
+        self._bump_versions((self.root_key,))
 
         self.root.t_liq -= liq
+        self.root.subtree_min_gap += _signed(liq)
+        self.root.subtree_max_t_liq -= liq
         self.root.token_x_borrow -= amount_x
         self.root.token_x_subtree_borrow -= amount_x
         self.root.token_y_borrow -= amount_y
         self.root.token_y_subtree_borrow -= amount_y
 
     # endregion
+
+    # region Batch Methods
+
+    def apply_batch(self, ops: List[tuple]) -> List:
+        """
+        Applies ops in order, each given as a method name followed by its arguments, ex. ("add_m_liq", LiqRange(1, 5), liq).
+        Each change only writes the nodes covering its range. Their ancestors are marked dirty and recomputed once,
+        bottom-up, before a query in the batch runs and when the batch ends.
+
+        Returns one result per op: the return value of a query, None for an applied change, or the exception
+        that rejected a change. Rejected changes leave the tree untouched.
+        """
+        results: List = []
+
+        # The fee rates can't move during a batch, so a node only needs its fees handled once
+        settled: set = set()
+        dirty: set = set()
+
+        # A malformed op raises out of the batch, the ops before it stay applied as if run one by one
+        try:
+            for name, *args in ops:
+                if name.startswith("query_"):
+                    self._recompute_dirty(dirty)
+                    results.append(getattr(self, name)(*args))
+                    continue
+
+                try:
+                    self._apply_batch_change(name, args, settled, dirty)
+                    results.append(None)
+                except _BATCH_REJECTIONS as e:
+                    results.append(e)
+        finally:
+            self._recompute_dirty(dirty)
+
+            # Not before the batch ends, a node dropped and looked up again would miss its fees being handled.
+            # The batch wrote the settled nodes and read the children of the recomputed ones.
+            if self.compact_nodes:
+                self._compact_keys(settled | {child for key in settled for child in LiquidityKey.children(key)})
+        return results
+
+    def _apply_batch_change(self, name: str, args: list, settled: set, dirty: set) -> None:
+        if name not in _BATCH_CHANGES:
+            raise ValueError("Unknown batch op " + name)
+
+        wide: bool = "_wide_" in name
+        adding: bool = name.startswith("add_")
+
+        if wide:
+            liq_range = None
+            covers, ancestors = [self.root_key], []
+        else:
+            liq_range, args = args[0], args[1:]
+            self._check_range_args(liq_range, args[0])
+            covers, ancestors = self._range_keys(liq_range)
+
+        liq = self._amount(args[0])
+        apply = (lambda a, b: a + b) if adding else (lambda a, b: a - b)
+        apply_inverse = (lambda a, b: a - b) if adding else (lambda a, b: a + b)
+
+        # Stage every write first so that a rejected change leaves no trace, fees included
+        staged: list = []
+        for key in covers:
+            node: LiqNode = self._view_node(key)
+            node_range: UnsignedDecimal = self._node_ranges[key >> 24]
+
+            if name.endswith("m_liq"):
+                values = {
+                    "m_liq": apply(node.m_liq, liq),
+                    "subtree_min_gap": apply(node.subtree_min_gap, _signed(liq)),
+                    "subtree_min_m_liq": apply(node.subtree_min_m_liq, liq),
+                    "subtree_m_liq": apply(node.subtree_m_liq, liq * node_range),
+                }
+                if not wide and node.t_liq > values["m_liq"]:
+                    raise LiquidityExceptionTLiqExceedsMLiq()
+            else:
+                if wide:
+                    borrow_x, borrow_y = self._amount(args[1]), self._amount(args[2])
+                else:
+                    borrow_x = self._per_tick(args[1], liq_range) * node_range
+                    borrow_y = self._per_tick(args[2], liq_range) * node_range
+
+                values = {
+                    "t_liq": apply(node.t_liq, liq),
+                    "subtree_min_gap": apply_inverse(node.subtree_min_gap, _signed(liq)),
+                    "subtree_max_t_liq": apply(node.subtree_max_t_liq, liq),
+                    "token_x_borrow": apply(node.token_x_borrow, borrow_x),
+                    "token_x_subtree_borrow": apply(node.token_x_subtree_borrow, borrow_x),
+                    "token_y_borrow": apply(node.token_y_borrow, borrow_y),
+                    "token_y_subtree_borrow": apply(node.token_y_subtree_borrow, borrow_y),
+                }
+                if not wide and adding and values["t_liq"] > node.m_liq:
+                    raise LiquidityExceptionTLiqExceedsMLiq()
+
+            staged.append((key, values))
+
+        # Handle fees top down. A node first touched here sees every earlier change of the batch, the same as unbatched.
+        aux_levels: dict = {self.root_key: self._num(0)}
+        for key in sorted(set(covers + ancestors), reverse=True):
+            if key != self.root_key:
+                up, _ = LiquidityKey.generic_up(key)
+                aux_levels[key] = aux_levels[up] + self.nodes[up].m_liq
+            if key not in settled:
+                self.handle_fee(key, self.nodes[key], aux_levels[key])
+                settled.add(key)
+
+        for key, values in staged:
+            node = self.nodes[key]
+            for field, value in values.items():
+                setattr(node, field, value)
+
+        self._bump_versions(covers + ancestors)
+
+        dirty.update(ancestors)
+
+    def _recompute_dirty(self, dirty: set) -> None:
+        # Children have a smaller range, so ascending keys visit them before their parents
+        for key in sorted(dirty):
+            left_key, right_key = LiquidityKey.children(key)
+            left, right, node = self.nodes[left_key], self.nodes[right_key], self.nodes[key]
+
+            node.subtree_m_liq = left.subtree_m_liq + right.subtree_m_liq + node.m_liq * self._node_ranges[key >> 24]
+            node.token_x_subtree_borrow = left.token_x_subtree_borrow + right.token_x_subtree_borrow + node.token_x_borrow
+            node.token_y_subtree_borrow = left.token_y_subtree_borrow + right.token_y_subtree_borrow + node.token_y_borrow
+            self._propagate_liq_bounds(left, right, node)
+
+        self._bump_versions(dirty)
+        dirty.clear()
+
+    def _check_range_args(self, liq_range: LiqRange, liq: UnsignedDecimal) -> None:
+        # Rejects ranges and liquidity that no range op can apply
+        if liq == UnsignedDecimal("0"):
+            raise LiquidityExceptionZeroLiquidity()
+        if liq_range.low < UnsignedDecimal("0"):
+            raise LiquidityExceptionRangeContainsNegative()
+        if liq_range.high < UnsignedDecimal("0"):
+            raise LiquidityExceptionRangeContainsNegative()
+        if liq_range.low == UnsignedDecimal("0") and liq_range.high == UnsignedDecimal(self.width - 1):
+            raise LiquidityExceptionRootRange()
+        if liq_range.high >= UnsignedDecimal(self.width):
+            raise LiquidityExceptionOversizedRange()
+        if liq_range.high < liq_range.low:
+            raise LiquidityExceptionRangeHighBelowLow()
+
+    def _range_keys(self, liq_range: LiqRange) -> (List[int], List[int]):
+        """The keys whose own liquidity changes for the range, and every ancestor above them, in the order the legs visit them."""
+        plan: TraversalPlan = LiquidityKey.traversal_plan(liq_range.low, liq_range.high, self.width)
+        return list(plan.covers), list(plan.ancestors)
+
+    # endregion
+
+    # region Bulk Construction
+
+    @classmethod
+    def from_positions(cls, depth: int, positions: Iterable[tuple], **options) -> 'LiquidityTree':
+        """
+        Builds a tree holding every position, each given as (liq_range, m_liq, t_liq, amount_x, amount_y) the same as
+        add_m_liq and add_t_liq take them, with a liq_range of None for a wide position. Options go to the constructor.
+        Every position is summed onto the nodes covering its range, then the subtree fields are computed in one sweep
+        from the leaves up, instead of walking both legs to the root per position. The fee rates start at zero, same as a new tree.
+        """
+        liq_tree: LiquidityTree = cls(depth, **options)
+        liq_tree._build_positions(positions)
+        return liq_tree
+
+    def _build_positions(self, positions: Iterable[tuple]) -> None:
+        m_liqs, t_liqs, borrows_x, borrows_y = {}, {}, {}, {}
+        zero: UnsignedDecimal = self._num(0)
+
+        for liq_range, m_liq, t_liq, amount_x, amount_y in positions:
+            if liq_range is None:
+                covers: List[int] = [self.root_key]
+                x_per_tick, y_per_tick = self._amount(amount_x), self._amount(amount_y)
+            else:
+                self._check_range_args(liq_range, m_liq or t_liq)
+                covers = LiquidityKey.covers(liq_range.low, liq_range.high, self.width)
+                x_per_tick, y_per_tick = self._per_tick(amount_x, liq_range), self._per_tick(amount_y, liq_range)
+            m_liq, t_liq = self._amount(m_liq), self._amount(t_liq)
+
+            for key in covers:
+                if m_liq != 0:
+                    m_liqs[key] = m_liqs.get(key, zero) + m_liq
+                if t_liq != 0 or x_per_tick != 0 or y_per_tick != 0:
+                    # A wide borrow is already the root's, a range borrow is spread over the ticks of each node
+                    node_range: UnsignedDecimal = self._num(1) if liq_range is None else self._node_ranges[key >> 24]
+                    t_liqs[key] = t_liqs.get(key, zero) + t_liq
+                    borrows_x[key] = borrows_x.get(key, zero) + x_per_tick * node_range
+                    borrows_y[key] = borrows_y.get(key, zero) + y_per_tick * node_range
+
+        # Checked on the totals, so the order of the positions doesn't matter. Same as the ops, the root isn't checked.
+        for key, t_liq in t_liqs.items():
+            if key != self.root_key and t_liq > m_liqs.get(key, zero):
+                raise LiquidityExceptionTLiqExceedsMLiq()
+
+        # Every written node and every ancestor of one
+        keys: set = set(m_liqs) | set(t_liqs)
+        keys.update(LiquidityKey.ancestors_of(keys, self.root_key))
+
+        # Children have a smaller range, so ascending keys visit them before their parents
+        for key in sorted(keys):
+            node: LiqNode = self.nodes[key]
+            node.m_liq = m_liqs.get(key, zero)
+            node.t_liq = t_liqs.get(key, zero)
+            node.token_x_borrow = borrows_x.get(key, zero)
+            node.token_y_borrow = borrows_y.get(key, zero)
+
+            # Leaves have no children, and children never written stay empty without being created
+            if key >> 24 == 1:
+                left = right = self._empty_node
+            else:
+                left_key, right_key = LiquidityKey.children(key)
+                left, right = self._view_node(left_key), self._view_node(right_key)
+
+            node.subtree_m_liq = left.subtree_m_liq + right.subtree_m_liq + node.m_liq * self._node_ranges[key >> 24]
+            node.token_x_subtree_borrow = left.token_x_subtree_borrow + right.token_x_subtree_borrow + node.token_x_borrow
+            node.token_y_subtree_borrow = left.token_y_subtree_borrow + right.token_y_subtree_borrow + node.token_y_borrow
+            self._propagate_liq_bounds(left, right, node)
+
+        self._bump_versions(keys)
+
+    # endregion
+
+    # region Export
+
+    def export_ticks(self) -> TickDistribution:
+        """
+        Returns the mLiq, tLiq and borrows of every tick, as a range query of each single tick would see them.
+        Ancestor values are pushed down in one walk from the root. A subtree with no nodes holds nothing of its own,
+        so its ticks are filled with what was pushed down to it, making this O(nodes + width).
+        """
+        zero: UnsignedDecimal = self._num(0)
+        m_liqs: List[UnsignedDecimal] = [zero] * self.width
+        t_liqs: List[UnsignedDecimal] = [zero] * self.width
+        borrows_x: List[UnsignedDecimal] = [zero] * self.width
+        borrows_y: List[UnsignedDecimal] = [zero] * self.width
+
+        stack: List[tuple] = [(self.root_key, zero, zero, zero, zero)]
+        while stack:
+            key, m_liq, t_liq, borrow_x, borrow_y = stack.pop()
+            node_range: int = key >> 24
+            node: LiqNode = self.nodes.get(key)
+
+            if node is not None:
+                m_liq += node.m_liq
+                t_liq += node.t_liq
+                borrow_x += self._tick_share(node.token_x_borrow, node_range)
+                borrow_y += self._tick_share(node.token_y_borrow, node_range)
+
+                if node_range > 1:
+                    left_key, right_key = LiquidityKey.children(key)
+                    stack.append((left_key, m_liq, t_liq, borrow_x, borrow_y))
+                    stack.append((right_key, m_liq, t_liq, borrow_x, borrow_y))
+                    continue
+
+            low: int = (key & 0xFFFFFF) - self.width
+            high: int = low + node_range
+            m_liqs[low:high] = [m_liq] * node_range
+            t_liqs[low:high] = [t_liq] * node_range
+            borrows_x[low:high] = [borrow_x] * node_range
+            borrows_y[low:high] = [borrow_y] * node_range
+
+        return TickDistribution(m_liqs, t_liqs, borrows_x, borrows_y)
+
+    def _tick_share(self, borrow: UnsignedDecimal, node_range: int) -> UnsignedDecimal:
+        # Range borrows are spread over whole ticks already, only the wide borrow on the root can leave a remainder
+        if self.integer_arithmetic:
+            return borrow // node_range
+        return borrow / node_range
+
+    # endregion
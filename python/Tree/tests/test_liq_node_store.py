@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+from dataclasses import fields
+from unittest import TestCase
+
+from Tree.LiqNodeStore import CopyOnWriteNodeStore, DenseNodeStore, FORK_LAYER_LIMIT, LiqNodeFileException, MmapNodeStore
+from Tree.LiquidityTree import LiquidityTree, LiqNode, LiqRange
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+
+
+class TestDenseNodeStore(TestCase):
+    def setUp(self) -> None:
+        self.store = DenseNodeStore(4, LiqNode())
+
+    def test_heap_index(self):
+        self.assertEqual(DenseNodeStore.heap_index((16 << 24) | 16), 1)
+        self.assertEqual(DenseNodeStore.heap_index((8 << 24) | 24), 3)
+        self.assertEqual(DenseNodeStore.heap_index((2 << 24) | 26), 13)
+        self.assertEqual(DenseNodeStore.heap_index((1 << 24) | 31), 31)
+
+        for index in range(1, 32):
+            self.assertEqual(DenseNodeStore.heap_index(self.store.key_at(index)), index)
+
+    def test_writes_go_to_columns(self):
+        node: LiqNode = self.store[(4 << 24) | 20]
+        node.m_liq += UnsignedDecimal(5)
+        node.t_liq = UnsignedDecimal(2)
+
+        self.assertEqual(self.store.column("m_liq")[5], 5)
+        self.assertEqual(self.store[(4 << 24) | 20].m_liq, 5)
+        self.assertEqual(self.store[(4 << 24) | 20].gap(), 3)
+        self.assertEqual(self.store.node((4 << 24) | 20), LiqNode(m_liq=UnsignedDecimal(5), t_liq=UnsignedDecimal(2)))
+
+    def test_lookup_creates_like_defaultdict(self):
+        self.assertNotIn((1 << 24) | 17, self.store)
+        self.assertIsNone(self.store.get((1 << 24) | 17))
+
+        self.store[(1 << 24) | 17].m_liq = UnsignedDecimal(1)
+        self.store[(2 << 24) | 18]
+
+        self.assertIn((1 << 24) | 17, self.store)
+        self.assertEqual(list(self.store), [(2 << 24) | 18, (1 << 24) | 17])
+        self.assertEqual(len(self.store), 2)
+
+    def test_delete_resets_node(self):
+        self.store[(1 << 24) | 17].m_liq = UnsignedDecimal(1)
+        del self.store[(1 << 24) | 17]
+
+        self.assertNotIn((1 << 24) | 17, self.store)
+        self.assertEqual(self.store[(1 << 24) | 17].m_liq, 0)
+
+    def test_invalid_keys(self):
+        # Not a node of a depth 4 tree
+        self.assertRaises(KeyError, lambda: self.store[(1 << 24) | 301])
+        self.assertRaises(KeyError, lambda: self.store[(2 << 24) | 17])
+        self.assertRaises(KeyError, lambda: self.store[(32 << 24) | 32])
+        self.assertNotIn((2 << 24) | 17, self.store)
+
+
+class TestCopyOnWriteNodeStore(TestCase):
+    def setUp(self) -> None:
+        self.shared = {(1 << 24) | 17: LiqNode(m_liq=UnsignedDecimal(3))}
+        self.store = CopyOnWriteNodeStore((self.shared,), LiqNode())
+
+    def test_lookup_copies_shared_node(self):
+        self.assertIs(self.store.get((1 << 24) | 17), self.shared[(1 << 24) | 17])
+
+        self.store[(1 << 24) | 17].m_liq += UnsignedDecimal(1)
+        self.assertEqual(self.store[(1 << 24) | 17].m_liq, 4)
+        self.assertEqual(self.shared[(1 << 24) | 17].m_liq, 3)
+
+    def test_lookup_creates_like_defaultdict(self):
+        self.assertNotIn((2 << 24) | 18, self.store)
+        self.store[(2 << 24) | 18].m_liq = UnsignedDecimal(1)
+
+        self.assertEqual(set(self.store), {(1 << 24) | 17, (2 << 24) | 18})
+        self.assertNotIn((2 << 24) | 18, self.shared)
+
+    def test_delete_hides_shared_node(self):
+        del self.store[(1 << 24) | 17]
+
+        self.assertNotIn((1 << 24) | 17, self.store)
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store[(1 << 24) | 17].m_liq, 0)
+        self.assertIn((1 << 24) | 17, self.shared)
+
+    def test_freeze_flattens_layers(self):
+        store: CopyOnWriteNodeStore = self.store
+        for _ in range(FORK_LAYER_LIMIT + 1):
+            store[(1 << 24) | 17].m_liq += UnsignedDecimal(1)
+            store = CopyOnWriteNodeStore(CopyOnWriteNodeStore.freeze(store), LiqNode())
+
+        self.assertLessEqual(len(store._layers), FORK_LAYER_LIMIT)
+        self.assertEqual(store[(1 << 24) | 17].m_liq, 3 + FORK_LAYER_LIMIT + 1)
+
+
+class TestDenseLiquidityTree(TestCase):
+    @staticmethod
+    def apply(liq_tree: LiquidityTree) -> None:
+        liq_tree.add_wide_m_liq(UnsignedDecimal(100))
+        liq_tree.add_m_liq(LiqRange(1, 12), UnsignedDecimal(50))
+        liq_tree.add_m_liq(LiqRange(3, 7), UnsignedDecimal(20))
+        liq_tree.add_t_liq(LiqRange(1, 12), UnsignedDecimal(30), UnsignedDecimal(1200), UnsignedDecimal(24))
+        liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal(7e20)
+        liq_tree.token_y_fee_rate_snapshot += UnsignedDecimal(3e20)
+        liq_tree.add_t_liq(LiqRange(3, 7), UnsignedDecimal(10), UnsignedDecimal(50), UnsignedDecimal(5))
+        liq_tree.remove_m_liq(LiqRange(3, 7), UnsignedDecimal(5))
+        liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal(2e20)
+        liq_tree.remove_t_liq(LiqRange(1, 12), UnsignedDecimal(30), UnsignedDecimal(1200), UnsignedDecimal(24))
+        liq_tree.add_wide_t_liq(UnsignedDecimal(10), UnsignedDecimal(160), UnsignedDecimal(16))
+
+    def test_matches_node_dict(self):
+        sparse: LiquidityTree = LiquidityTree(depth=4)
+        dense: LiquidityTree = LiquidityTree(depth=4, dense_nodes=True)
+        self.apply(sparse)
+        self.apply(dense)
+
+        self.assertEqual(set(sparse.nodes), set(dense.nodes))
+        for key, node in sparse.nodes.items():
+            self.assertEqual(dense.nodes[key], node)
+
+        for low, high in [(1, 12), (3, 7), (0, 0), (9, 15)]:
+            self.assertEqual(dense.query_accumulated_fee_rates(LiqRange(low, high)), sparse.query_accumulated_fee_rates(LiqRange(low, high)))
+            self.assertEqual(dense.query_min_m_liq_max_t_liq(LiqRange(low, high)), sparse.query_min_m_liq_max_t_liq(LiqRange(low, high)))
+
+    def test_root_is_a_reference(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, integer_arithmetic=True, dense_nodes=True)
+        liq_tree.add_wide_m_liq(10)
+
+        self.assertEqual(liq_tree.root.m_liq, 10)
+        self.assertEqual(liq_tree.nodes.column("subtree_m_liq")[1], 160)
+
+
+class TestMmapNodeStore(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "nodes")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_matches_node_dict(self):
+        for integer_arithmetic in (False, True):
+            sparse: LiquidityTree = LiquidityTree(depth=4, integer_arithmetic=integer_arithmetic)
+            mapped: LiquidityTree = LiquidityTree(depth=4, integer_arithmetic=integer_arithmetic, node_file=self.path + str(integer_arithmetic))
+            if integer_arithmetic:
+                for liq_tree in (sparse, mapped):
+                    liq_tree.add_wide_m_liq(100)
+                    liq_tree.update_range(LiqRange(1, 12), 50, 30, 1201, 24)
+                    liq_tree.token_x_fee_rate_snapshot += 7 * 10 ** 20
+                    liq_tree.update_range(LiqRange(3, 7), 20, 10, 50, 5)
+            else:
+                TestDenseLiquidityTree.apply(sparse)
+                TestDenseLiquidityTree.apply(mapped)
+
+            self.assertEqual(set(sparse.nodes), set(mapped.nodes))
+            for key, node in sparse.nodes.items():
+                self.assertEqual(mapped.nodes[key], node)
+            self.assertEqual(mapped.query_accumulated_fee_rates(LiqRange(3, 7)), sparse.query_accumulated_fee_rates(LiqRange(3, 7)))
+
+            mapped.nodes.close()
+
+    def test_matches_node_dict_after_repaying(self):
+        sparse: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+        mapped: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True, node_file=self.path)
+        for liq_tree in (sparse, mapped):
+            liq_tree.add_wide_m_liq(UnsignedDecimal("20"))
+            liq_tree.add_m_liq(LiqRange(1, 3), UnsignedDecimal("90"))
+            liq_tree.add_t_liq(LiqRange(1, 3), UnsignedDecimal("10"), UnsignedDecimal("100"), UnsignedDecimal("7"))
+            liq_tree.add_t_liq(LiqRange(1, 3), UnsignedDecimal("10"), UnsignedDecimal("200"), UnsignedDecimal("7"))
+            liq_tree.remove_t_liq(LiqRange(1, 3), UnsignedDecimal("10"), UnsignedDecimal("300"), UnsignedDecimal("7"))
+            liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+            liq_tree.add_m_liq(LiqRange(2, 3), UnsignedDecimal("5"))
+            liq_tree.remove_t_liq(LiqRange(1, 3), UnsignedDecimal("10"), UnsignedDecimal("0"), UnsignedDecimal("7"))
+
+        # Zeros left by arithmetic read back as the Decimals written, not the UnsignedDecimal defaults
+        self.assertEqual(set(sparse.nodes), set(mapped.nodes))
+        for key, node in sparse.nodes.items():
+            self.assertEqual(mapped.nodes[key], node)
+            for field in fields(LiqNode):
+                self.assertIs(type(getattr(mapped.nodes[key], field.name)), type(getattr(node, field.name)))
+
+        mapped.nodes.close()
+
+    def test_reopen(self):
+        sparse: LiquidityTree = LiquidityTree(depth=4)
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, node_file=self.path)
+        TestDenseLiquidityTree.apply(sparse)
+        TestDenseLiquidityTree.apply(liq_tree)
+        liq_tree.nodes.close()
+
+        store: MmapNodeStore = MmapNodeStore(4, LiqNode(), self.path)
+        self.assertEqual(set(store), set(sparse.nodes))
+        for key, node in sparse.nodes.items():
+            self.assertEqual(store.node(key), node)
+        store.close()
+
+        # A file laid out for another tree
+        self.assertRaises(LiqNodeFileException, lambda: MmapNodeStore(5, LiqNode(), self.path))
+        self.assertRaises(LiqNodeFileException, lambda: MmapNodeStore(4, LiqNode.uint256(), self.path))
+
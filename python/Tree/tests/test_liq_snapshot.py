@@ -0,0 +1,85 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from FloatingPoint.UnsignedDecimal import UnsignedDecimal
+from Tree.LiqSnapshot import LiqSnapshotFormatException, SNAPSHOT_VERSION, load_tree, save_tree
+from Tree.LiquidityTree import LiquidityTree, LiqNode, LiqRange
+
+
+class TestLiqSnapshot(TestCase):
+    def setUp(self) -> None:
+        handle, self.path = tempfile.mkstemp(suffix=".liqtree")
+        os.close(handle)
+
+    def tearDown(self) -> None:
+        os.remove(self.path)
+
+    @staticmethod
+    def apply(liq_tree: LiquidityTree, number) -> None:
+        liq_tree.add_wide_m_liq(number(100))
+        liq_tree.add_m_liq(LiqRange(1, 12), number(50))
+        liq_tree.add_m_liq(LiqRange(3, 7), number(20))
+        liq_tree.add_t_liq(LiqRange(1, 12), number(30), number(1201), number(24))
+        liq_tree.token_x_fee_rate_snapshot += number(7 * 10 ** 20)
+        liq_tree.token_y_fee_rate_snapshot += number(3 * 10 ** 20)
+        liq_tree.add_t_liq(LiqRange(3, 7), number(10), number(50), number(5))
+        liq_tree.add_wide_t_liq(number(10), number(160), number(16))
+
+    def assert_same_tree(self, loaded: LiquidityTree, liq_tree: LiquidityTree) -> None:
+        self.assertEqual(set(loaded.nodes), set(liq_tree.nodes))
+        for key in liq_tree.nodes:
+            self.assertEqual(loaded.nodes.get(key), liq_tree.nodes.get(key))
+        self.assertEqual(loaded.token_x_fee_rate_snapshot, liq_tree.token_x_fee_rate_snapshot)
+        self.assertEqual(loaded.token_y_fee_rate_snapshot, liq_tree.token_y_fee_rate_snapshot)
+
+    def test_round_trip_decimal(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4)
+        self.apply(liq_tree, UnsignedDecimal)
+        save_tree(liq_tree, self.path)
+
+        loaded: LiquidityTree = load_tree(self.path)
+        self.assertFalse(loaded.integer_arithmetic)
+        self.assert_same_tree(loaded, liq_tree)
+
+    def test_round_trip_uint256(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, integer_arithmetic=True, dense_nodes=True)
+        self.apply(liq_tree, int)
+        save_tree(liq_tree, self.path)
+
+        loaded: LiquidityTree = load_tree(self.path)
+        self.assertTrue(loaded.integer_arithmetic)
+        self.assert_same_tree(loaded, liq_tree)
+        self.assertIsInstance(loaded.nodes.get(loaded.root_key).m_liq, int)
+
+    def test_loaded_tree_keeps_working(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+        self.apply(liq_tree, UnsignedDecimal)
+        save_tree(liq_tree, self.path)
+        loaded: LiquidityTree = load_tree(self.path)
+
+        # Reading decodes from the file without copying a node into memory
+        self.assertEqual(loaded.query_accumulated_fee_rates(LiqRange(3, 7)), liq_tree.query_accumulated_fee_rates(LiqRange(3, 7)))
+        self.assertEqual(len(loaded.nodes._own), 0)
+
+        for each in (liq_tree, loaded):
+            each.token_x_fee_rate_snapshot += UnsignedDecimal(10 ** 20)
+            each.remove_t_liq(LiqRange(3, 7), UnsignedDecimal(10), UnsignedDecimal(50), UnsignedDecimal(5))
+            each.add_m_liq(LiqRange(8, 8), UnsignedDecimal(1))
+        self.assert_same_tree(loaded, liq_tree)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as out:
+            out.write(b"\0" * 64)
+        self.assertRaises(LiqSnapshotFormatException, lambda: load_tree(self.path))
+
+        save_tree(LiquidityTree(depth=2), self.path)
+        with open(self.path, "r+b") as out:
+            out.seek(8)
+            out.write((SNAPSHOT_VERSION + 1).to_bytes(4, "little"))
+        self.assertRaises(LiqSnapshotFormatException, lambda: load_tree(self.path))
+
+        save_tree(LiquidityTree(depth=2), self.path)
+        with open(self.path, "r+b") as out:
+            out.truncate(os.path.getsize(self.path) - 16)
+        self.assertRaises(LiqSnapshotFormatException, lambda: load_tree(self.path))
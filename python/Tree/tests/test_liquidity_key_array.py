@@ -0,0 +1,52 @@
+import random
+from unittest import TestCase, skipIf
+
+from Tree.LiqNodeStore import DenseNodeStore
+from Tree.LiquidityKey import LiquidityKey
+from Tree.LiquidityTree import LiqNode
+
+try:
+    from Tree.LiquidityKeyArray import LiquidityKeyArray
+except ImportError:
+    LiquidityKeyArray = None
+
+
+@skipIf(LiquidityKeyArray is None, "NumPy is not installed")
+class TestLiquidityKeyArray(TestCase):
+
+    def test_keys_match_scalar(self):
+        rand = random.Random(7)
+        for depth in (1, 4, 20):
+            width: int = 1 << depth
+            lows = [rand.randrange(width) for _ in range(500)]
+            highs = [rand.randrange(low, width) for low in lows]
+
+            columns = [LiquidityKeyArray.to_keys(column) for column in LiquidityKeyArray.keys(lows, highs, width)]
+            for idx, (low, high) in enumerate(zip(lows, highs)):
+                self.assertEqual(tuple(column[idx] for column in columns), LiquidityKey.keys(low, high, width))
+
+    def test_children_and_up_match_scalar(self):
+        keys = [(16 << 24) | 16, (8 << 24) | 24, (2 << 24) | 26, (1 << 24) | 31]
+
+        lefts, rights = LiquidityKeyArray.children(keys)
+        ups, others = LiquidityKeyArray.generic_up(keys)
+        for idx, key in enumerate(keys):
+            self.assertEqual((int(lefts[idx]), int(rights[idx])), LiquidityKey.children(key))
+            self.assertEqual((int(ups[idx]), int(others[idx])), LiquidityKey.generic_up(key))
+
+    def test_topology(self):
+        topology = LiquidityKeyArray.topology(4)
+        store: DenseNodeStore = DenseNodeStore(4, LiqNode())
+
+        self.assertEqual(LiquidityKeyArray.to_keys(topology.keys[topology.level(0)]), [(16 << 24) | 16])
+        self.assertEqual(LiquidityKeyArray.to_keys(topology.keys[topology.level(1)]), [(8 << 24) | 16, (8 << 24) | 24])
+        self.assertEqual(int(topology.parents[1]), 0)
+        self.assertEqual(int(topology.lefts[16]), 0)
+
+        for index in range(2, 32):
+            self.assertEqual(int(topology.keys[index]), store.key_at(index))
+            self.assertEqual(int(topology.parents[index]), store.key_at(index >> 1))
+            self.assertEqual(int(topology.siblings[index]), store.key_at(index ^ 1))
+        for index in range(1, 16):
+            self.assertEqual(int(topology.lefts[index]), store.key_at(2 * index))
+            self.assertEqual(int(topology.rights[index]), store.key_at(2 * index + 1))
@@ -1,3 +1,5 @@
+import random
+
 from FloatingPoint.FloatingPointTestCase import FloatingPointTestCase
 from FloatingPoint.UnsignedDecimal import *
 from Tree.LiquidityTree import *
@@ -1621,6 +1623,423 @@ class TestLiquidityTree(FloatingPointTestCase):
     def test_fee_accumulation_removing_t_liq_when_flipping_node_from_right_to_left_child(self):
         pass
 
+    # region Liquidity Bounds
+
+    def test_query_min_m_liq_max_t_liq_over_overlapping_ranges(self):
+        liq_tree: LiquidityTree = self.liq_tree
+
+        liq_tree.add_wide_m_liq(UnsignedDecimal("5"))
+        liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        liq_tree.add_m_liq(LiqRange(4, 12), UnsignedDecimal("10"))
+        liq_tree.add_t_liq(LiqRange(8, 11), UnsignedDecimal("8"), UnsignedDecimal("10"), UnsignedDecimal("10"))
+        liq_tree.add_t_liq(LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("10"), UnsignedDecimal("10"))
+
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(1, 6)), (45, 30))
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(4, 6)), (55, 30))
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(7, 12)), (15, 8))
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(0, 3)), (5, 30))
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(13, 13)), (5, 0))
+        self.assertEqual(liq_tree.query_wide_min_m_liq_max_t_liq(), (5, 30))
+
+    def test_query_liq_gap(self):
+        liq_tree: LiquidityTree = self.liq_tree
+
+        liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        liq_tree.add_m_liq(LiqRange(4, 12), UnsignedDecimal("10"))
+        liq_tree.add_t_liq(LiqRange(8, 11), UnsignedDecimal("8"), UnsignedDecimal("10"), UnsignedDecimal("10"))
+        liq_tree.add_t_liq(LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("10"), UnsignedDecimal("10"))
+
+        self.assertEqual(liq_tree.query_liq_gap(LiqRange(1, 6)), 10)
+        self.assertEqual(liq_tree.query_liq_gap(LiqRange(4, 5)), 20)
+        self.assertEqual(liq_tree.query_liq_gap(LiqRange(7, 9)), 2)
+        self.assertEqual(liq_tree.query_wide_liq_gap(), 0)
+
+        liq_tree.remove_t_liq(LiqRange(8, 11), UnsignedDecimal("8"), UnsignedDecimal("10"), UnsignedDecimal("10"))
+        liq_tree.remove_m_liq(LiqRange(4, 12), UnsignedDecimal("10"))
+
+        self.assertEqual(liq_tree.query_liq_gap(LiqRange(1, 6)), 10)
+        self.assertEqual(liq_tree.query_liq_gap(LiqRange(6, 6)), 40)
+        self.assertEqual(liq_tree.query_min_m_liq_max_t_liq(LiqRange(4, 12)), (0, 30))
+
+    # endregion
+
+    # region Fee Rate Queries
+
+    def test_query_accumulated_fee_rates_many_matches_single_queries(self):
+        liq_tree: LiquidityTree = self.liq_tree
+
+        liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+        liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        liq_tree.add_m_liq(LiqRange(4, 12), UnsignedDecimal("10"))
+        liq_tree.add_t_liq(LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("4000"), UnsignedDecimal("120"))
+        liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        liq_tree.add_t_liq(LiqRange(8, 11), UnsignedDecimal("8"), UnsignedDecimal("10000"), UnsignedDecimal("240"))
+        liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        liq_tree.token_y_fee_rate_snapshot += UnsignedDecimal("36893488147419103232000")
+
+        ranges = [LiqRange(low, high) for low in range(liq_tree.width) for high in range(low, liq_tree.width)]
+        ranges.append(LiqRange(2, 5))
+        node_count: int = len(liq_tree.nodes)
+
+        rates = liq_tree.query_accumulated_fee_rates_many(ranges)
+        self.assertEqual(rates, [liq_tree.query_accumulated_fee_rates(liq_range) for liq_range in ranges])
+        self.assertGreater(rates[-1][0], 0)
+        self.assertEqual(len(liq_tree.nodes), node_count)
+
+    def test_query_cache_invalidated_by_writes(self):
+        cached: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True, query_cache=True)
+        for liq_tree in (self.liq_tree, cached):
+            liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+            liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+            liq_tree.add_t_liq(LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("4000"), UnsignedDecimal("120"))
+            liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        rates = cached.query_accumulated_fee_rates(LiqRange(1, 6))
+        self.assertIs(cached.query_accumulated_fee_rates(LiqRange(1, 6)), rates)
+        self.assertEqual(rates, self.liq_tree.query_accumulated_fee_rates(LiqRange(1, 6)))
+
+        # A moved fee rate, a range op, a batch and a wide op each change what the range reads
+        changes = [
+            lambda liq_tree: setattr(liq_tree, "token_x_fee_rate_snapshot", liq_tree.token_x_fee_rate_snapshot + UnsignedDecimal("18446744073709551616000")),
+            lambda liq_tree: liq_tree.add_m_liq(LiqRange(4, 9), UnsignedDecimal("10")),
+            lambda liq_tree: liq_tree.apply_batch([("add_t_liq", LiqRange(4, 9), UnsignedDecimal("5"), UnsignedDecimal("800"), UnsignedDecimal("8"))]),
+            lambda liq_tree: liq_tree.add_wide_t_liq(UnsignedDecimal("5"), UnsignedDecimal("160"), UnsignedDecimal("16")),
+        ]
+        for change in changes:
+            for liq_tree in (self.liq_tree, cached):
+                change(liq_tree)
+                liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+            self.assertEqual(cached.query_accumulated_fee_rates(LiqRange(1, 6)), self.liq_tree.query_accumulated_fee_rates(LiqRange(1, 6)))
+            self.assertEqual(cached.query_min_m_liq_max_t_liq(LiqRange(1, 6)), self.liq_tree.query_min_m_liq_max_t_liq(LiqRange(1, 6)))
+            self.assertEqual(cached.query_liq_gap(LiqRange(3, 8)), self.liq_tree.query_liq_gap(LiqRange(3, 8)))
+
+    # endregion
+
+    # region Batch
+
+    def _random_batch(self, rand: random.Random, ranges: List[LiqRange], liquidity: dict, size: int) -> List[tuple]:
+        """Random valid ops, keeping the tLiq of each range within its mLiq. Liquidity is tracked per range, None being wide."""
+        ops: List[tuple] = []
+        for _ in range(size):
+            liq_range: Optional[LiqRange] = rand.choice(ranges + [None])
+            key = None if liq_range is None else (liq_range.low, liq_range.high)
+            (m_liq, t_liq) = liquidity.get(key, (0, 0))
+            prefix: tuple = ("_wide_",) if liq_range is None else ("_", liq_range)
+            amount: int = rand.randrange(1, 40)
+            # Borrows split evenly over the ticks, so both paths round the same way
+            borrow: int = amount * (1 if liq_range is None else liq_range.high - liq_range.low + 1)
+
+            op: int = rand.randrange(4)
+            if op == 1 and m_liq - t_liq >= amount:
+                m_liq -= amount
+                ops.append(("remove" + prefix[0] + "m_liq", *prefix[1:], UnsignedDecimal(amount)))
+            elif op == 2 and m_liq - t_liq >= amount:
+                t_liq += amount
+                ops.append(("add" + prefix[0] + "t_liq", *prefix[1:], UnsignedDecimal(amount), UnsignedDecimal(borrow * 16), UnsignedDecimal(borrow * 4)))
+            elif op == 3 and t_liq >= amount:
+                t_liq -= amount
+                ops.append(("remove" + prefix[0] + "t_liq", *prefix[1:], UnsignedDecimal(amount), UnsignedDecimal(borrow * 16), UnsignedDecimal(borrow * 4)))
+            else:
+                m_liq += amount * 2
+                ops.append(("add" + prefix[0] + "m_liq", *prefix[1:], UnsignedDecimal(amount * 2)))
+            liquidity[key] = (m_liq, t_liq)
+        return ops
+
+    def test_batch_matches_single_ops(self):
+        for seed in range(20):
+            rand = random.Random(seed)
+            ranges = [LiqRange(low, rand.randrange(low, 16)) for low in (rand.randrange(16) for _ in range(8))]
+            ranges = [liq_range for liq_range in ranges if (liq_range.low, liq_range.high) != (0, 15)]
+            liquidity: dict = {}
+
+            batched: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+            unbatched: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+            for _ in range(4):
+                ops = self._random_batch(rand, ranges, liquidity, 12)
+                for name, *args in ops:
+                    getattr(unbatched, name)(*args)
+                self.assertEqual(batched.apply_batch(ops), [None] * len(ops))
+
+                fee_rate = UnsignedDecimal(rand.randrange(1 << 80))
+                for tree in (batched, unbatched):
+                    tree.token_x_fee_rate_snapshot += fee_rate
+                    tree.token_y_fee_rate_snapshot += fee_rate
+
+            self.assertEqual(set(batched.nodes), set(unbatched.nodes))
+            for key, node in unbatched.nodes.items():
+                self.assertEqual(batched.nodes[key], node)
+
+    def test_batch_query_sees_earlier_ops(self):
+        results = self.liq_tree.apply_batch([
+            ("add_m_liq", LiqRange(1, 6), UnsignedDecimal("40")),
+            ("query_min_m_liq_max_t_liq", LiqRange(1, 6)),
+            ("add_t_liq", LiqRange(2, 5), UnsignedDecimal("30"), UnsignedDecimal("10"), UnsignedDecimal("10")),
+            ("query_liq_gap", LiqRange(0, 7)),
+        ])
+
+        self.assertEqual(results, [None, (40, 0), None, 0])
+
+    def test_batch_rejected_op_leaves_tree_untouched(self):
+        self.liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        self.liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        keys = set(self.liq_tree.nodes)
+
+        results = self.liq_tree.apply_batch([
+            ("add_t_liq", LiqRange(2, 9), UnsignedDecimal("30"), UnsignedDecimal("10"), UnsignedDecimal("10")),
+            ("add_m_liq", LiqRange(0, 15), UnsignedDecimal("40")),
+            ("add_m_liq", LiqRange(3, 2), UnsignedDecimal("40")),
+        ])
+
+        self.assertIsInstance(results[0], LiquidityExceptionTLiqExceedsMLiq)
+        self.assertIsInstance(results[1], LiquidityExceptionRootRange)
+        self.assertIsInstance(results[2], LiquidityExceptionRangeHighBelowLow)
+        self.assertEqual(set(self.liq_tree.nodes), keys)
+        self.assertEqual(self.liq_tree.nodes[2 << 24 | 18].token_x_fee_rate_snapshot, 0)
+        self.assertEqual(self.liq_tree.query_wide_min_m_liq_max_t_liq(), (0, 0))
+
+    def test_batch_malformed_op_keeps_earlier_ops(self):
+        unbatched: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+        unbatched.add_m_liq(LiqRange(1, 2), UnsignedDecimal("5"))
+
+        for malformed in [("bogus", UnsignedDecimal("1")), ("add_m_liq", LiqRange(3, 4))]:
+            liq_tree: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+            with self.assertRaises((ValueError, IndexError)):
+                liq_tree.apply_batch([
+                    ("add_m_liq", LiqRange(1, 2), UnsignedDecimal("5")),
+                    malformed,
+                    ("add_m_liq", LiqRange(5, 9), UnsignedDecimal("5")),
+                ])
+
+            # The ancestors of the applied op were still recomputed
+            self.assertEqual(liq_tree.root.subtree_m_liq, 10)
+            for key, node in unbatched.nodes.items():
+                self.assertEqual(liq_tree.nodes[key], node)
+
+    # endregion
+
+    # region Fused Update
+
+    def test_update_range_matches_single_ops(self):
+        unfused: LiquidityTree = LiquidityTree(depth=4, sol_truncation=True)
+        for liq_tree in (self.liq_tree, unfused):
+            liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+            liq_tree.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+            liq_tree.add_t_liq(LiqRange(2, 9), UnsignedDecimal("10"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+            liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+            liq_tree.token_y_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        # Opening a taker
+        rates = self.liq_tree.update_range(LiqRange(1, 6), 40, 30, 600, 60)
+        unfused.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        unfused.add_t_liq(LiqRange(1, 6), UnsignedDecimal("30"), UnsignedDecimal("600"), UnsignedDecimal("60"))
+        self.assertEqual(rates, unfused.query_accumulated_fee_rates(LiqRange(1, 6)))
+
+        self.liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        unfused.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        # Closing it, the tLiq has to come off before the mLiq when done one at a time
+        rates = self.liq_tree.update_range(LiqRange(1, 6), -40, -30, -600, -60)
+        unfused.remove_t_liq(LiqRange(1, 6), UnsignedDecimal("30"), UnsignedDecimal("600"), UnsignedDecimal("60"))
+        unfused.remove_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        self.assertEqual(rates, unfused.query_accumulated_fee_rates(LiqRange(1, 6)))
+
+        self.assertEqual(set(self.liq_tree.nodes), set(unfused.nodes))
+        for key, node in unfused.nodes.items():
+            self.assertEqual(self.liq_tree.nodes[key], node)
+
+    def test_update_range_t_liq_exceeds_m_liq(self):
+        self.assertRaises(LiquidityExceptionTLiqExceedsMLiq, lambda: self.liq_tree.update_range(LiqRange(1, 6), 10, 11, 0, 0))
+        self.assertRaises(LiquidityExceptionZeroLiquidity, lambda: self.liq_tree.update_range(LiqRange(1, 6)))
+
+    # endregion
+
+    # region Traversal Plan
+
+    def test_traversal_plan_keys(self):
+        plan = LiquidityKey.traversal_plan(1, 6, self.liq_tree.width)
+
+        # [1], [2-3], [6], [4-5]
+        self.assertEqual(plan.covers, (1 << 24 | 17, 2 << 24 | 18, 1 << 24 | 22, 2 << 24 | 20))
+        # [0-1], [0-3], [6-7], [4-7], [0-7], root
+        self.assertEqual(plan.ancestors, (2 << 24 | 16, 4 << 24 | 16, 2 << 24 | 22, 4 << 24 | 20, 8 << 24 | 16, 16 << 24 | 16))
+        self.assertEqual(plan.legs[0].ancestors, LiquidityKey.ancestors(1 << 24 | 17, self.liq_tree.root_key))
+
+    def test_traversal_plan_is_cached(self):
+        self.liq_tree.add_m_liq(LiqRange(3, 11), UnsignedDecimal("10"))
+        hits = LiquidityKey.traversal_plan.cache_info().hits
+        self.liq_tree.add_m_liq(LiqRange(3, 11), UnsignedDecimal("10"))
+        self.assertEqual(LiquidityKey.traversal_plan.cache_info().hits, hits + 1)
+
+        # Plans are shared by trees of the same width
+        other: LiquidityTree = LiquidityTree(depth=4)
+        other.add_m_liq(LiqRange(3, 11), UnsignedDecimal("20"))
+        self.assertEqual(LiquidityKey.traversal_plan.cache_info().hits, hits + 2)
+        self.assertEqual(self.liq_tree.nodes[4 << 24 | 20].m_liq, other.nodes[4 << 24 | 20].m_liq)
+
+    def test_decompose_matches_traversal_plan(self):
+        for low in range(self.liq_tree.width):
+            for high in range(low, self.liq_tree.width):
+                plan = LiquidityKey.traversal_plan(low, high, self.liq_tree.width)
+                keys = list(LiquidityKey.decompose(low, high, self.liq_tree.width))
+                self.assertEqual(sorted(key for key, cover in keys if cover), sorted(plan.covers))
+                self.assertEqual([key for key, cover in keys if not cover], sorted(set(plan.ancestors)))
+
+        # [1], [2-3] and [2-3], [4-5], then [0-1], [0-3], [4-7], [0-7], root once each
+        keys = list(LiquidityKey.decompose_many([LiqRange(1, 3), LiqRange(2, 5)], self.liq_tree.width))
+        self.assertEqual(keys, [(1 << 24 | 17, True), (2 << 24 | 18, True), (2 << 24 | 20, True),
+                                (2 << 24 | 16, False), (4 << 24 | 16, False), (4 << 24 | 20, False), (8 << 24 | 16, False), (16 << 24 | 16, False)])
+
+    # endregion
+
+    # region Fork
+
+    def test_fork_is_independent(self):
+        self.liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+        self.liq_tree.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+        self.liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        fork: LiquidityTree = self.liq_tree.fork()
+        fork.update_range(LiqRange(1, 6), 40, 30, 600, 60)
+        self.liq_tree.remove_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+
+        self.assertEqual(fork.query_min_m_liq_max_t_liq(LiqRange(2, 9)), (UnsignedDecimal("150"), UnsignedDecimal("30")))
+        self.assertEqual(self.liq_tree.query_min_m_liq_max_t_liq(LiqRange(2, 9)), (UnsignedDecimal("100"), UnsignedDecimal("0")))
+        self.assertEqual(fork.root.m_liq, 100)
+
+        # Snapshots belong to each tree
+        fork.token_x_fee_rate_snapshot += UnsignedDecimal("1")
+        self.assertEqual(self.liq_tree.token_x_fee_rate_snapshot, UnsignedDecimal("18446744073709551616000"))
+
+    def test_fork_copies_only_touched_nodes(self):
+        for low in range(0, 16, 2):
+            self.liq_tree.add_m_liq(LiqRange(low, low + 1), UnsignedDecimal("10"))
+
+        fork: LiquidityTree = self.liq_tree.fork()
+        fork.add_m_liq(LiqRange(4, 5), UnsignedDecimal("10"))
+
+        # [4-5], then [4-7], [0-7] and the root with the sibling under each
+        self.assertEqual(len(fork.nodes._own), 7)
+        self.assertIs(fork.nodes.get(2 << 24 | 28), self.liq_tree.nodes.get(2 << 24 | 28))
+
+        same: LiquidityTree = LiquidityTree(depth=4)
+        for low in range(0, 16, 2):
+            same.add_m_liq(LiqRange(low, low + 1), UnsignedDecimal("10"))
+        same.add_m_liq(LiqRange(4, 5), UnsignedDecimal("10"))
+        for key, node in same.nodes.items():
+            self.assertEqual(fork.nodes[key], node)
+
+    # endregion
+
+    # region Compaction
+
+    def test_compaction_drops_emptied_nodes(self):
+        liq_tree: LiquidityTree = LiquidityTree(depth=4, compact_nodes=True)
+        liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+        liq_tree.update_range(LiqRange(1, 6), 40, 30, 600, 60)
+        liq_tree.apply_batch([("add_m_liq", LiqRange(9, 14), UnsignedDecimal("10"))])
+        liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        liq_tree.update_range(LiqRange(1, 6), -40, -30, -600, -60)
+        liq_tree.apply_batch([("remove_m_liq", LiqRange(9, 14), UnsignedDecimal("10"))])
+        self.assertEqual(list(liq_tree.nodes), [liq_tree.root_key])
+
+    def test_compaction_keeps_open_position_rates(self):
+        compacted: LiquidityTree = LiquidityTree(depth=4, compact_nodes=True)
+        for liq_tree in (self.liq_tree, compacted):
+            liq_tree.add_m_liq(LiqRange(2, 9), UnsignedDecimal("50"))
+            liq_tree.add_t_liq(LiqRange(2, 9), UnsignedDecimal("10"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+            liq_tree.update_range(LiqRange(3, 12), 40, 30, 600, 60)
+            liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+            liq_tree.update_range(LiqRange(3, 12), -40, -30, -600, -60)
+
+        entry = (self.liq_tree.query_accumulated_fee_rates(LiqRange(2, 9)), compacted.query_accumulated_fee_rates(LiqRange(2, 9)))
+        for liq_tree in (self.liq_tree, compacted):
+            liq_tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+            liq_tree.add_m_liq(LiqRange(12, 13), UnsignedDecimal("5"))
+
+        node_count: int = len(self.liq_tree.nodes)
+        self.assertLess(len(compacted.nodes), node_count)
+        self.assertEqual(self.liq_tree.compact(), node_count - len(compacted.nodes))
+        self.assertEqual(set(self.liq_tree.nodes), set(compacted.nodes))
+
+        earned = [
+            tuple(rate - entry_rate for rate, entry_rate in zip(liq_tree.query_accumulated_fee_rates(LiqRange(2, 9)), entry_rates))
+            for liq_tree, entry_rates in zip((self.liq_tree, compacted), entry)
+        ]
+        self.assertEqual(earned[0], earned[1])
+        self.assertGreater(earned[0][0], 0)
+
+    # endregion
+
+    # region Bulk Construction
+
+    def test_from_positions_matches_single_ops(self):
+        positions = [
+            (None, UnsignedDecimal("100"), UnsignedDecimal("0"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+            (LiqRange(1, 6), UnsignedDecimal("40"), UnsignedDecimal("0"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+            (LiqRange(4, 12), UnsignedDecimal("10"), UnsignedDecimal("0"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+            (LiqRange(2, 5), UnsignedDecimal("40"), UnsignedDecimal("30"), UnsignedDecimal("400"), UnsignedDecimal("12")),
+            (LiqRange(8, 11), UnsignedDecimal("0"), UnsignedDecimal("8"), UnsignedDecimal("1000"), UnsignedDecimal("24")),
+            (None, UnsignedDecimal("0"), UnsignedDecimal("5"), UnsignedDecimal("160"), UnsignedDecimal("16")),
+        ]
+
+        for integer_arithmetic in (False, True):
+            single: LiquidityTree = LiquidityTree(depth=4, integer_arithmetic=integer_arithmetic)
+            for liq_range, m_liq, t_liq, amount_x, amount_y in positions:
+                if liq_range is None:
+                    if m_liq != 0:
+                        single.add_wide_m_liq(m_liq)
+                    if t_liq != 0:
+                        single.add_wide_t_liq(t_liq, amount_x, amount_y)
+                    continue
+                if m_liq != 0:
+                    single.add_m_liq(liq_range, m_liq)
+                if t_liq != 0:
+                    single.add_t_liq(liq_range, t_liq, amount_x, amount_y)
+
+            built: LiquidityTree = LiquidityTree.from_positions(4, positions, integer_arithmetic=integer_arithmetic)
+
+            # The ops also create the siblings they read, which stay empty
+            self.assertLessEqual(set(built.nodes), set(single.nodes))
+            for key in single.nodes:
+                self.assertEqual(built._view_node(key), single.nodes[key])
+            self.assertEqual(built.query_liq_gap(LiqRange(3, 9)), single.query_liq_gap(LiqRange(3, 9)))
+
+    def test_from_positions_t_liq_exceeds_m_liq(self):
+        # Fine once the mLiq of the later position is in
+        LiquidityTree.from_positions(4, [
+            (LiqRange(2, 5), UnsignedDecimal("0"), UnsignedDecimal("30"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+            (LiqRange(2, 5), UnsignedDecimal("40"), UnsignedDecimal("0"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+        ])
+        self.assertRaises(LiquidityExceptionTLiqExceedsMLiq, lambda: LiquidityTree.from_positions(4, [
+            (LiqRange(2, 5), UnsignedDecimal("20"), UnsignedDecimal("30"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+        ]))
+        self.assertRaises(LiquidityExceptionRootRange, lambda: LiquidityTree.from_positions(4, [
+            (LiqRange(0, 15), UnsignedDecimal("20"), UnsignedDecimal("0"), UnsignedDecimal("0"), UnsignedDecimal("0")),
+        ]))
+
+    # endregion
+
+    # region Export
+
+    def test_export_ticks_matches_tick_queries(self):
+        self.liq_tree.add_wide_m_liq(UnsignedDecimal("100"))
+        self.liq_tree.add_m_liq(LiqRange(1, 6), UnsignedDecimal("40"))
+        self.liq_tree.add_m_liq(LiqRange(2, 9), UnsignedDecimal("30"))
+        self.liq_tree.add_t_liq(LiqRange(2, 9), UnsignedDecimal("30"), UnsignedDecimal("800"), UnsignedDecimal("80"))
+        self.liq_tree.add_wide_t_liq(UnsignedDecimal("5"), UnsignedDecimal("160"), UnsignedDecimal("16"))
+
+        ticks: TickDistribution = self.liq_tree.export_ticks()
+        for tick in range(self.liq_tree.width):
+            self.assertEqual((ticks.m_liq[tick], ticks.t_liq[tick]), self.liq_tree.query_min_m_liq_max_t_liq(LiqRange(tick, tick)))
+
+        # The wide borrow is spread over every tick, the range borrow over its 8 ticks
+        self.assertEqual(ticks.borrow_x, [10] * 2 + [110] * 8 + [10] * 6)
+        self.assertEqual(ticks.borrow_y, [1] * 2 + [11] * 8 + [1] * 6)
+
+    # endregion
+
     # region Errors
 
     def test_revert_removing_m_without_sufficient_m_liq(self):
@@ -0,0 +1,106 @@
+from unittest import TestCase
+
+from Integer.Uint256 import Uint256IsSignedException
+from Tree.LiquidityTree import LiquidityTree, LiqNode, LiqRange
+
+
+#                                                               root(0-16)
+#                                                       ____----    ----____
+#                                   __________----------                    ----------__________
+#                                  L(0-7)                                                       R(8-15)
+#                             __--  --__                                                    __--  --__
+#                        __---          ---__                                          __---          ---__
+#                      /                       \                                     /                       \
+#                   LL(0-3)                     LR(4-7)                           RL(8-11)                     RR(12-15)
+#                 /   \                         /   \                           /   \                         /   \
+#               /       \                     /       \                       /       \                     /       \
+#             /           \                 /           \                   /           \                 /           \
+#           LLL(0-1)       LLR(2-3)       LRL(4-5)       LRR(6-7)         RLL(8-9)       RLR(10-11)     RRL(12-13)     RRR(14-15)
+#          /    \          /    \          /    \          /    \         /    \          /    \          /    \          /    \
+#         /      \        /      \        /      \        /      \       /      \        /      \        /      \        /      \
+#   LLLL(0) LLLR(1) LLRL(2) LLRR(3) LRLL(4) LRLR(5) LRRL(6) LRRR(7) RLLL(8) RLLR(9) RLRL(10) RLRR(11) RRLL(12) RRLR(13) RRRL(14) RRRR(15)
+
+
+# NOTE: integer arithmetic truncates exactly where Tree.sol does, so values can be compared against solidity directly.
+class TestLiquidityTreeUint256(TestCase):
+    def setUp(self) -> None:
+        self.liq_tree = LiquidityTree(depth=4, integer_arithmetic=True)
+
+    def test_node_fields_are_ints(self):
+        self.liq_tree.add_wide_m_liq(100)
+        self.liq_tree.add_m_liq(LiqRange(1, 7), 20)
+        self.liq_tree.add_t_liq(LiqRange(1, 7), 10, 7000, 14)
+        self.liq_tree.token_x_fee_rate_snapshot += 2 ** 70
+
+        self.liq_tree.query_accumulated_fee_rates(LiqRange(1, 7))
+
+        for node in self.liq_tree.nodes.values():
+            for value in vars(node).values():
+                self.assertIs(type(value), int)
+
+    def test_borrow_split_truncates_per_tick_like_solidity(self):
+        self.liq_tree.add_m_liq(LiqRange(1, 7), 100)
+        self.liq_tree.add_t_liq(LiqRange(1, 7), 20, 12 * 10 ** 18, 19 * 10 ** 6)
+
+        # 12e18 / 7 = 1714285714285714285 per tick and 19e6 / 7 = 2714285 per tick
+        one_one: LiqNode = self.liq_tree.nodes[1 << 24 | 17]
+        self.assertEqual(one_one.token_x_borrow, 1714285714285714285)
+        self.assertEqual(one_one.token_y_borrow, 2714285)
+
+        four_seven: LiqNode = self.liq_tree.nodes[4 << 24 | 20]
+        self.assertEqual(four_seven.token_x_borrow, 4 * 1714285714285714285)
+        self.assertEqual(four_seven.token_y_borrow, 4 * 2714285)
+
+        zero_seven: LiqNode = self.liq_tree.nodes[8 << 24 | 16]
+        self.assertEqual(zero_seven.token_x_subtree_borrow, 7 * 1714285714285714285)
+        self.assertEqual(zero_seven.token_y_subtree_borrow, 7 * 2714285)
+
+    def test_node_range_in_fee_calculation(self):
+        self.liq_tree.add_wide_m_liq(1)
+        self.liq_tree.add_m_liq(LiqRange(0, 1), 4)
+        self.liq_tree.add_t_liq(LiqRange(0, 1), 1, 31, 31)
+
+        self.liq_tree.token_x_fee_rate_snapshot += 18446744073709551616
+        self.liq_tree.token_y_fee_rate_snapshot += 18446744073709551616
+        self.liq_tree.remove_t_liq(LiqRange(0, 1), 1, 1, 1)
+
+        # floor(30 * 2^64 / ((8 + 1 * 2) * 2^64)) with the borrow of 31 truncated to 15 per tick
+        zero_one: LiqNode = self.liq_tree.nodes[2 << 24 | 16]
+        self.assertEqual(zero_one.token_x_cumulative_earned_per_m_liq, 3)
+        self.assertEqual(zero_one.token_x_cumulative_earned_per_m_subtree_liq, 3)
+        self.assertEqual(zero_one.token_y_cumulative_earned_per_m_liq, 3)
+        self.assertEqual(zero_one.token_y_cumulative_earned_per_m_subtree_liq, 3)
+
+    def test_queries(self):
+        self.liq_tree.add_wide_m_liq(100)
+        self.liq_tree.add_m_liq(LiqRange(0, 7), 50)
+        self.liq_tree.add_t_liq(LiqRange(0, 7), 10, 8, 16)
+        self.liq_tree.token_x_fee_rate_snapshot += 18446744073709551616000
+        self.liq_tree.token_y_fee_rate_snapshot += 18446744073709551616000
+
+        self.assertEqual(self.liq_tree.query_wide_accumulated_fee_rates(), (4, 8))
+        # Same values as the truncating decimal tree: 8000 * 8 / 1600 + 8000 * 8 / 4800 for x
+        self.assertEqual(self.liq_tree.query_accumulated_fee_rates(LiqRange(0, 7)), (6, 13))
+        self.assertEqual(self.liq_tree.query_min_m_liq_max_t_liq(LiqRange(0, 7)), (150, 10))
+        self.assertEqual(self.liq_tree.query_liq_gap(LiqRange(0, 7)), 140)
+
+    def test_revert_removing_m_liq_without_sufficient_m_liq(self):
+        self.liq_tree.add_m_liq(LiqRange(3, 7), 10)
+        self.assertRaises(Uint256IsSignedException, lambda: self.liq_tree.remove_m_liq(LiqRange(3, 7), 11))
+
+    def test_revert_removing_t_liq_without_sufficient_x_borrow(self):
+        self.liq_tree.add_m_liq(LiqRange(3, 7), 10)
+        self.liq_tree.add_t_liq(LiqRange(3, 7), 10, 5, 5)
+        self.assertRaises(Uint256IsSignedException, lambda: self.liq_tree.remove_t_liq(LiqRange(3, 7), 10, 10, 5))
+
+    def test_revert_removing_wide_t_liq_without_sufficient_t_liq(self):
+        self.liq_tree.add_wide_m_liq(10)
+        self.liq_tree.add_wide_t_liq(5, 5, 5)
+        self.assertRaises(Uint256IsSignedException, lambda: self.liq_tree.remove_wide_t_liq(6, 5, 5))
+
+    def test_revert_on_fee_rate_decrease(self):
+        self.liq_tree.add_m_liq(LiqRange(3, 7), 10)
+        self.liq_tree.token_x_fee_rate_snapshot += 10
+        self.liq_tree.add_m_liq(LiqRange(3, 7), 10)
+        self.liq_tree.token_x_fee_rate_snapshot -= 5
+        self.assertRaises(Uint256IsSignedException, lambda: self.liq_tree.query_accumulated_fee_rates(LiqRange(3, 7)))
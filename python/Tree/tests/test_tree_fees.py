@@ -423,6 +423,17 @@ class TestTreeFees(FloatingPointTestCase):
         self.assertEqual(self._tree.nodes[1 << 24 | 30].m_liq, 1038)
         self.assertEqual(self._tree.nodes[1 << 24 | 31].m_liq, 1039)
 
+    def test_aux_array_matches_auxiliary_level(self):
+        self._allocate_auxillary_array()
+
+        aux_m_liqs = self._tree._compute_aux_array(1 << 24 | 21)
+        self.assertEqual(aux_m_liqs, [16384 + 8192 + 4097 + 2050, 16384 + 8192 + 4097, 16384 + 8192, 16384, 0])
+
+        current: int = 1 << 24 | 21
+        for aux_m_liq in aux_m_liqs:
+            self.assertEqual(aux_m_liq, self._tree.auxiliary_level_m_liq(current))
+            current, _ = LiquidityKey.generic_up(current)
+
     def test_aux_at_node_of_range_one(self):
         self._allocate_auxillary_array()
 
@@ -779,3 +790,51 @@ class TestTreeFees(FloatingPointTestCase):
         self.assertEqual(eight_fifteen.token_y_fee_rate_snapshot, UnsignedDecimal("0"))
 
     # endregion
+
+    # region Read Only Query
+
+    def test_query_views_pending_fees_without_writing(self):
+        self._tree.add_wide_m_liq(UnsignedDecimal("100"))
+        self._tree.add_m_liq(LiqRange(1, 12), UnsignedDecimal("50"))
+        self._tree.add_t_liq(LiqRange(1, 12), UnsignedDecimal("10"), UnsignedDecimal("1200"), UnsignedDecimal("24"))
+        self._tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        self._tree.token_y_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        keys = set(self._tree.nodes)
+        snapshots = {key: node.token_x_fee_rate_snapshot for key, node in self._tree.nodes.items()}
+
+        # (13-13) and (14-15) have never been written
+        viewed = self._tree.query_accumulated_fee_rates(LiqRange(13, 15))
+        self.assertEqual(viewed, self._tree.query_accumulated_fee_rates(LiqRange(13, 15)))
+        self._tree.query_accumulated_fee_rates(LiqRange(1, 12))
+        self._tree.query_wide_accumulated_fee_rates()
+
+        self.assertEqual(set(self._tree.nodes), keys)
+        self.assertEqual({key: node.token_x_fee_rate_snapshot for key, node in self._tree.nodes.items()}, snapshots)
+
+        # Settling the fees through a write agrees with what was viewed
+        self._tree.add_m_liq(LiqRange(13, 15), UnsignedDecimal("1"))
+        self.assertEqual(self._tree.nodes[4 << 24 | 28].token_x_fee_rate_snapshot, self._tree.token_x_fee_rate_snapshot)
+        self.assertEqual(self._tree.query_accumulated_fee_rates(LiqRange(13, 15)), viewed)
+
+    # endregion
+
+    # region Wide Query
+
+    def test_wide_accumulated_fee_rates_from_root(self):
+        self._tree.add_wide_m_liq(UnsignedDecimal("100"))
+        self._tree.add_m_liq(LiqRange(0, 7), UnsignedDecimal("50"))
+        self._tree.add_t_liq(LiqRange(0, 7), UnsignedDecimal("10"), UnsignedDecimal("8"), UnsignedDecimal("16"))
+        self._tree.token_x_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+        self._tree.token_y_fee_rate_snapshot += UnsignedDecimal("18446744073709551616000")
+
+        # 8 * 1000 / 2000 and 16 * 1000 / 2000
+        self.assertEqual(self._tree.query_wide_accumulated_fee_rates(), (4, 8))
+
+        # Viewing the fees leaves them pending on the root
+        root: LiqNode = self._tree.nodes[self._tree.root_key]
+        self.assertEqual(root.token_x_fee_rate_snapshot, 0)
+        self.assertEqual(root.token_x_cumulative_earned_per_m_subtree_liq, 0)
+        self.assertEqual(self._tree.query_wide_accumulated_fee_rates(), (4, 8))
+
+    # endregion